@@ -0,0 +1,96 @@
+import asyncio
+
+
+class MicroBatcher:
+    """Coalesce concurrent scoring requests into small batches
+
+    Requests are queued and flushed as one batch once max_batch_size items are
+    waiting or window_ms has passed since the first item of the batch arrived.
+    score_batch receives the list of queued items and must return one result
+    per item in the same order. It runs in the default executor so the event
+    loop keeps accepting requests while a batch is being scored.
+    """
+
+    def __init__(self, score_batch, window_ms=2.0, max_batch_size=64):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.score_batch = score_batch
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue = None
+        self._worker = None
+
+    @property
+    def queue_depth(self):
+        """Number of requests waiting for the next batch"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, item):
+        """Queue an item and wait for its result"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def stop(self):
+        """Stop the batching loop, failing any requests still queued"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Micro-batcher stopped"))
+        self._worker = None
+
+    async def _collect(self):
+        """Wait for the first item, then fill the batch until the window closes"""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                # Window closed, still take whatever is already queued
+                if self._queue.empty():
+                    break
+                batch.append(self._queue.get_nowait())
+                continue
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+
+            # Callers that went away no longer need scoring
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            try:
+                results = await loop.run_in_executor(
+                    None, self.score_batch, [item for item, _ in batch]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
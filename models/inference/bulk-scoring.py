@@ -0,0 +1,261 @@
+import argparse
+import importlib.util
+import io
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+INFERENCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Pipeline shared with the pool workers, which are forked after it is loaded
+_pipeline = None
+
+
+def load_inference_module():
+    """Import xgboost-inference.py, whose file name isn't a valid module name"""
+    if INFERENCE_DIR not in sys.path:
+        sys.path.insert(0, INFERENCE_DIR)
+    spec = importlib.util.spec_from_file_location(
+        'xgboost_inference', os.path.join(INFERENCE_DIR, 'xgboost-inference.py')
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _read_records(f, n_records):
+    """Raw lines of up to n_records CSV records, a quoted field may span lines"""
+    lines = []
+    records = 0
+    in_quotes = False
+    while records < n_records:
+        line = f.readline()
+        if not line:
+            break
+        lines.append(line)
+        # Escaped quotes come in pairs, so an odd count opens or closes a field
+        if line.count(b'"') % 2:
+            in_quotes = not in_quotes
+        if not in_quotes:
+            records += 1
+    return lines
+
+
+def iter_chunks(input_path, chunk_size, skip_rows=0, offset=None):
+    """Stream a CSV or Parquet file as (DataFrame of at most chunk_size rows, position) pairs
+
+    For CSV the position is the byte offset just after the chunk; passing
+    it back as offset resumes there without reading what came before.
+    Parquet positions are None and skip_rows is used instead.
+    """
+    if input_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(input_path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            if skip_rows >= batch.num_rows:
+                skip_rows -= batch.num_rows
+                continue
+            chunk = batch.to_pandas()
+            if skip_rows:
+                chunk = chunk.iloc[skip_rows:].reset_index(drop=True)
+                skip_rows = 0
+            yield chunk, None
+        return
+
+    with open(input_path, 'rb') as f:
+        header = f.readline()
+        if offset:
+            f.seek(offset)
+        else:
+            while skip_rows > 0:
+                skipped = min(skip_rows, chunk_size)
+                _read_records(f, skipped)
+                skip_rows -= skipped
+        while True:
+            lines = _read_records(f, chunk_size)
+            if not lines:
+                return
+            yield pd.read_csv(io.BytesIO(header + b''.join(lines)), low_memory=False), f.tell()
+
+
+def load_account_features(path, feature_names):
+    """Load a per-account feature table (AccountId plus graph/balance features)"""
+    features = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+    columns = [feature for feature in feature_names if feature in features.columns]
+    return features.drop_duplicates('AccountId').set_index('AccountId')[columns]
+
+
+def build_chunk_matrix(chunk, feature_names, account_features=None):
+    """Assemble the float32 feature matrix for a chunk, joining account features if given"""
+    if account_features is not None:
+        joined = account_features.reindex(chunk['AccountId'])
+        joined.index = chunk.index
+        chunk = pd.concat(
+            [chunk.drop(columns=joined.columns, errors='ignore'), joined], axis=1
+        )
+
+    missing = [feature for feature in feature_names if feature not in chunk.columns]
+    if missing:
+        raise ValueError(
+            f"Input is missing features {missing}, pass --account-features to join them on AccountId"
+        )
+
+    # Same fill as training for accounts without graph or balance data
+    return chunk[feature_names].fillna(0).to_numpy(dtype=np.float32)
+
+
+def _init_worker(threads):
+    _pipeline.set_threads(threads)
+
+
+def _score_chunk(X):
+    return _pipeline.predict_proba_matrix(X)
+
+
+class Checkpoint:
+    """Progress of a scoring run, saved after every chunk written"""
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.state = json.load(f)
+        return self.state
+
+    def save(self, **state):
+        self.state.update(state)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+
+def score_file(input_path, output_path, pipeline, chunk_size=100_000, workers=None,
+               keep_columns=('TransactionID', 'AccountId'), account_features_path=None,
+               resume=True):
+    """Score a transaction file chunk by chunk, writing results as they complete
+
+    Chunks are scored on a fork-based process pool with at most two chunks
+    in flight per worker, so memory stays flat regardless of file size.
+    Output is appended in input order and a checkpoint next to it records
+    how far the run got, including the CSV byte offset to read on from; a
+    rerun with resume=True continues from there.
+    """
+    global _pipeline
+    _pipeline = pipeline
+    workers = workers or os.cpu_count() or 1
+    feature_names = list(pipeline.feature_names)
+
+    account_features = None
+    if account_features_path:
+        account_features = load_account_features(account_features_path, feature_names)
+
+    checkpoint = Checkpoint(f'{output_path}.checkpoint.json')
+    state = checkpoint.load() if resume else {}
+    if state and (state.get('input') != os.path.abspath(input_path) or state.get('chunk_size') != chunk_size):
+        raise ValueError(f"Checkpoint {checkpoint.path} belongs to a different run, remove it or pass --no-resume")
+
+    rows_done = state.get('rows_done', 0)
+    if rows_done:
+        logger.info(f"Resuming after {rows_done} rows")
+        # Drop anything written after the last checkpoint
+        with open(output_path, 'r+b') as f:
+            f.truncate(state['output_bytes'])
+    else:
+        checkpoint.state = {}
+        open(output_path, 'w').close()
+        checkpoint.save(input=os.path.abspath(input_path), chunk_size=chunk_size, rows_done=0, output_bytes=0)
+
+    start_time = time.time()
+    max_in_flight = workers * 2
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(max(1, (os.cpu_count() or 1) // workers),)
+    ) as executor, open(output_path, 'a', newline='') as out:
+        pending = []
+
+        def write_oldest():
+            nonlocal rows_done
+            chunk_ids, input_offset, future = pending.pop(0)
+            result = chunk_ids.copy()
+            for column, values in pipeline.format_columns(future.result()).items():
+                result[column] = values
+
+            result.to_csv(out, header=out.tell() == 0, index=False)
+            out.flush()
+            os.fsync(out.fileno())
+
+            rows_done += len(result)
+            checkpoint.save(rows_done=rows_done, output_bytes=out.tell(), input_offset=input_offset)
+            logger.info(f"Scored {rows_done} rows ({rows_done / (time.time() - start_time):,.0f} rows/s)")
+
+        chunks = iter_chunks(input_path, chunk_size, skip_rows=rows_done, offset=state.get('input_offset'))
+        for chunk, input_offset in chunks:
+            X = build_chunk_matrix(chunk, feature_names, account_features)
+            chunk_ids = chunk[[column for column in keep_columns if column in chunk.columns]]
+            pending.append((chunk_ids, input_offset, executor.submit(_score_chunk, X)))
+            if len(pending) >= max_in_flight:
+                write_oldest()
+
+        while pending:
+            write_oldest()
+
+    checkpoint.save(completed=True)
+    logger.info(f"Finished scoring {rows_done} rows in {time.time() - start_time:.2f} seconds")
+    return rows_done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score a transaction file with the current fraud model")
+    parser.add_argument('input', help="CSV or Parquet transaction file")
+    parser.add_argument('output', help="CSV file to write predictions to")
+    parser.add_argument('--chunk-size', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=None, help="Scoring processes, defaults to the CPU count")
+    parser.add_argument('--account-features', default=None,
+                        help="CSV or Parquet per-account features joined on AccountId")
+    parser.add_argument('--keep-columns', nargs='*', default=['TransactionID', 'AccountId'],
+                        help="Input columns copied to the output")
+    parser.add_argument('--no-resume', action='store_true', help="Ignore an existing checkpoint and start over")
+    args = parser.parse_args()
+
+    inference = load_inference_module()
+    # Loading only, the booster's threads must not start before the pool forks
+    inference.load_serving_pipeline(warm_up_modes=())
+    logger.info(f"Scoring with model version {inference.registry.version}")
+
+    score_file(
+        args.input,
+        args.output,
+        inference.registry.pipeline,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        keep_columns=args.keep_columns,
+        account_features_path=args.account_features,
+        resume=not args.no_resume
+    )
+
+
+if __name__ == "__main__":
+    main()
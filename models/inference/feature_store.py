@@ -0,0 +1,209 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+GRAPH_FEATURES = ('in_degree', 'out_degree', 'in_weight', 'out_weight')
+
+
+def parse_creditor_account_ids(creditor_accounts):
+    """Extract recipient AccountIds from CreditorAccount dict strings without eval"""
+    return creditor_accounts.astype(str).str.extract(r"""['"]AccountId['"]\s*:\s*['"]([^'"]+)['"]""")[0]
+
+
+class AccountFeatureStore:
+    """In-memory per-account graph features, updated as transfers settle
+
+    Mirrors create_fast_graph_features in training/sample2.py: parallel
+    transfers between two accounts are one edge, degrees count distinct
+    counterparties and weights sum transferred amounts. Features live in
+    NumPy arrays indexed by an integer account index, so a lookup is a dict
+    hit plus four array reads.
+
+    Each account also carries a risk score, the share of its past transfers
+    labelled as fraud, smoothed towards the model's fraud probability for
+    every transfer it sends afterwards. It is the fallback when there is no
+    time left to run the model.
+
+    Settled transfers are applied once per transaction id; the last
+    max_recorded_ids ids are remembered so a transfer reported again is
+    ignored.
+    """
+
+    # Weight of the newest model score in the running account risk
+    RISK_SMOOTHING = 0.1
+
+    # Initial value of each array for accounts without data
+    _EMPTY = {'risk': np.nan}
+
+    def __init__(self, capacity=1024, max_recorded_ids=100000):
+        self.account_index = {}
+        self.account_ids = []
+        self._edges = set()
+        self._recorded_ids = OrderedDict()
+        self.max_recorded_ids = max_recorded_ids
+        self._arrays = {
+            'in_degree': np.zeros(capacity, dtype=np.int64),
+            'out_degree': np.zeros(capacity, dtype=np.int64),
+            'in_weight': np.zeros(capacity, dtype=np.float64),
+            'out_weight': np.zeros(capacity, dtype=np.float64),
+            'risk': np.full(capacity, np.nan),
+        }
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.account_ids)
+
+    @classmethod
+    def from_transactions(cls, transactions_df):
+        """Build the store from a transactions frame in one vectorized pass"""
+        import pandas as pd
+
+        if 'ToAccountId' in transactions_df.columns:
+            to_accounts = transactions_df['ToAccountId']
+        else:
+            to_accounts = parse_creditor_account_ids(transactions_df['CreditorAccount'])
+
+        senders = transactions_df['AccountId'].astype(str)
+        has_receiver = to_accounts.notna().to_numpy()
+        receivers = to_accounts[has_receiver].astype(str)
+
+        codes, uniques = pd.factorize(pd.concat([senders, receivers], ignore_index=True))
+        sender_codes = codes[:len(senders)]
+        src, dst = sender_codes[has_receiver], codes[len(senders):]
+        amounts = transactions_df['TransactionAmount'].astype(float).to_numpy()[has_receiver]
+        edge_weights = pd.DataFrame({'src': src, 'dst': dst, 'amount': amounts}) \
+            .groupby(['src', 'dst'], sort=False)['amount'].sum().reset_index()
+
+        n_accounts = len(uniques)
+        store = cls(capacity=max(n_accounts * 2, 1024))
+        store.account_ids = [str(account_id) for account_id in uniques]
+        store.account_index = {account_id: i for i, account_id in enumerate(store.account_ids)}
+
+        edge_src = edge_weights['src'].to_numpy()
+        edge_dst = edge_weights['dst'].to_numpy()
+        edge_amount = edge_weights['amount'].to_numpy()
+        store._arrays['out_degree'][:n_accounts] = np.bincount(edge_src, minlength=n_accounts)
+        store._arrays['in_degree'][:n_accounts] = np.bincount(edge_dst, minlength=n_accounts)
+        store._arrays['out_weight'][:n_accounts] = np.bincount(edge_src, weights=edge_amount, minlength=n_accounts)
+        store._arrays['in_weight'][:n_accounts] = np.bincount(edge_dst, weights=edge_amount, minlength=n_accounts)
+        store._edges = set(zip(edge_src.tolist(), edge_dst.tolist()))
+        if 'TransactionID' in transactions_df.columns:
+            # Settled transfers from the history, so reporting them again is a no-op
+            recorded = transactions_df['TransactionID'].dropna().astype(str).tail(store.max_recorded_ids)
+            store._recorded_ids = OrderedDict.fromkeys(recorded.tolist())
+
+        if 'FraudType' in transactions_df.columns:
+            fraud_type = transactions_df['FraudType']
+            is_fraud = (fraud_type.notna() & (fraud_type.astype(str).str.lower() != 'no_fraud')).to_numpy()
+            sent = np.bincount(sender_codes, minlength=n_accounts)
+            fraud_sent = np.bincount(sender_codes, weights=is_fraud, minlength=n_accounts)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                store._arrays['risk'][:n_accounts] = np.where(sent > 0, fraud_sent / sent, np.nan)
+
+        logger.info(f"Feature store built with {n_accounts} accounts and {len(store._edges)} edges")
+        return store
+
+    @classmethod
+    def from_csv(cls, transactions_path):
+        # pandas is only needed to build the store, keep it out of service import
+        import pandas as pd
+
+        transactions_df = pd.read_csv(
+            transactions_path,
+            usecols=lambda column: column in (
+                'TransactionID', 'AccountId', 'CreditorAccount', 'TransactionAmount', 'FraudType'
+            ),
+            low_memory=False
+        )
+        return cls.from_transactions(transactions_df)
+
+    def _index(self, account_id):
+        """Integer index for an account, registering unseen accounts (caller holds the lock)"""
+        index = self.account_index.get(account_id)
+        if index is None:
+            index = len(self.account_ids)
+            if index == len(self._arrays['in_degree']):
+                for name, array in self._arrays.items():
+                    grown = np.full(len(array) * 2, self._EMPTY.get(name, 0), dtype=array.dtype)
+                    grown[:len(array)] = array
+                    self._arrays[name] = grown
+            self.account_index[account_id] = index
+            self.account_ids.append(account_id)
+        return index
+
+    def get_features(self, account_id):
+        """Graph features for an account, zeros for accounts never seen"""
+        index = self.account_index.get(account_id)
+        if index is None:
+            return {feature: 0 for feature in GRAPH_FEATURES}
+        arrays = self._arrays
+        return {
+            'in_degree': int(arrays['in_degree'][index]),
+            'out_degree': int(arrays['out_degree'][index]),
+            'in_weight': float(arrays['in_weight'][index]),
+            'out_weight': float(arrays['out_weight'][index]),
+        }
+
+    def get_feature_matrix(self, account_ids):
+        """(n_accounts, len(GRAPH_FEATURES)) feature matrix, zero rows for accounts never seen"""
+        account_index = self.account_index
+        indices = np.fromiter(
+            (account_index.get(account_id, -1) for account_id in account_ids),
+            dtype=np.int64,
+            count=len(account_ids)
+        )
+        known = indices >= 0
+        matrix = np.zeros((len(indices), len(GRAPH_FEATURES)))
+        for j, feature in enumerate(GRAPH_FEATURES):
+            matrix[known, j] = self._arrays[feature][indices[known]]
+        return matrix
+
+    def get_risk(self, account_id):
+        """Precomputed risk score of an account, None if it has no history"""
+        index = self.account_index.get(account_id)
+        if index is None:
+            return None
+        risk = self._arrays['risk'][index]
+        return None if np.isnan(risk) else float(risk)
+
+    def record_risk(self, scores):
+        """Blend (account, fraud probability) model scores into the account risk"""
+        with self._lock:
+            for account_id, score in scores:
+                index = self._index(account_id)
+                risk = self._arrays['risk']
+                previous = risk[index]
+                risk[index] = score if np.isnan(previous) else (
+                    previous + self.RISK_SMOOTHING * (score - previous)
+                )
+
+    def add_transfers(self, transfers):
+        """Apply (transaction id, sender, receiver, amount) transfers to the aggregates
+
+        Returns how many were applied, transfers whose id was already
+        recorded are skipped.
+        """
+        applied = 0
+        with self._lock:
+            for transaction_id, sender, receiver, amount in transfers:
+                if transaction_id in self._recorded_ids:
+                    continue
+                self._recorded_ids[transaction_id] = None
+                if len(self._recorded_ids) > self.max_recorded_ids:
+                    self._recorded_ids.popitem(last=False)
+
+                src = self._index(sender)
+                dst = self._index(receiver)
+                arrays = self._arrays
+                if (src, dst) not in self._edges:
+                    self._edges.add((src, dst))
+                    arrays['out_degree'][src] += 1
+                    arrays['in_degree'][dst] += 1
+                arrays['out_weight'][src] += amount
+                arrays['in_weight'][dst] += amount
+                applied += 1
+        return applied
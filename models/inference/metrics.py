@@ -0,0 +1,260 @@
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from 100us up to the slowest SHAP batches
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5
+)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class Histogram:
+    """Fixed-bucket histogram, one series per label set"""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts plus +Inf, and the running sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """JSON-serializable copy of every series"""
+        with self._lock:
+            return [
+                [[list(pair) for pair in key], list(counts), total]
+                for key, (counts, total) in self._series.items()
+            ]
+
+    def render(self, snapshots=None):
+        """Prometheus text, summed over (pid, snapshot()) pairs of several processes when given"""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        if snapshots is None:
+            snapshots = [(None, self.snapshot())]
+        merged = {}
+        for _, snapshot in snapshots:
+            for key, counts, total in snapshot:
+                key = tuple(tuple(pair) for pair in key)
+                series = merged.setdefault(key, [[0] * len(counts), 0.0])
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += total
+        series = [(key, counts, total) for key, (counts, total) in merged.items()]
+
+        for key, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(key + (("le", bound),))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {cumulative}')
+        return '\n'.join(lines)
+
+
+class Counter:
+    """Monotonically increasing count"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+    def render(self, snapshots=None):
+        """Prometheus text, summed over (pid, snapshot()) pairs of several processes when given"""
+        value = self.value if snapshots is None else sum(snapshot for _, snapshot in snapshots)
+        return '\n'.join([
+            f'# HELP {self.name} {self.help_text}',
+            f'# TYPE {self.name} counter',
+            f'{self.name} {value}'
+        ])
+
+
+class Gauge:
+    """Single value gauge, either set directly or read from a callback at scrape time"""
+
+    def __init__(self, name, help_text, callback=None):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return float(self.callback() if self.callback is not None else self.value)
+
+    def render(self, snapshots=None):
+        """Prometheus text, one series per live process labelled by pid when snapshots are given
+
+        Gauges of processes that exited (pid None) are left out.
+        """
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge']
+        if snapshots is None:
+            lines.append(f'{self.name} {self.snapshot()}')
+        else:
+            for pid, snapshot in sorted((pid, snapshot) for pid, snapshot in snapshots if pid is not None):
+                lines.append(f'{self.name}{_format_labels((("pid", pid),))} {snapshot}')
+        return '\n'.join(lines)
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together in Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, buckets))
+
+    def counter(self, name, help_text):
+        return self.register(Counter(name, help_text))
+
+    def gauge(self, name, help_text, callback=None):
+        return self.register(Gauge(name, help_text, callback))
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def render(self, snapshots=None):
+        """Prometheus text of this process, or merged over (pid, snapshot()) pairs when given"""
+        if snapshots is None:
+            return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+        return '\n'.join(
+            metric.render([(pid, snapshot[name]) for pid, snapshot in snapshots if name in snapshot])
+            for name, metric in self._metrics.items()
+        ) + '\n'
+
+
+class MultiprocessMetrics:
+    """Aggregate a registry across pre-fork workers through snapshot files
+
+    Each worker writes its registry's snapshot to <directory>/<pid>.json
+    every flush_interval seconds and before rendering, so whichever worker
+    takes a scrape reports counters and histograms summed over all workers.
+    Snapshots of exited workers are kept, so the sums never go down when a
+    worker is replaced. Gauges are per process and reported for live workers
+    only, labelled by pid.
+    """
+
+    def __init__(self, registry, directory, flush_interval=1.0):
+        self.registry = registry
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Remove snapshots left by a previous run, called by the parent before forking"""
+        os.makedirs(self.directory, exist_ok=True)
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            os.remove(path)
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'{pid}.json')
+
+    def start(self):
+        """Start flushing this worker's snapshot, called in the worker after fork"""
+        path = self._path(os.getpid())
+        if os.path.exists(path):
+            # An exited worker had the same pid, keep its counts under another name
+            os.replace(path, os.path.join(self.directory, f'{os.getpid()}-{time.time_ns()}.json'))
+        self.flush()
+        threading.Thread(target=self._flush_periodically, name='metrics-flush', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError as e:
+                logger.warning(f"Failed to write metrics snapshot: {str(e)}")
+
+    def flush(self):
+        path = self._path(os.getpid())
+        temporary = f'{path}.tmp'
+        with self._lock:
+            with open(temporary, 'w') as f:
+                json.dump({'pid': os.getpid(), 'metrics': self.registry.snapshot()}, f)
+            os.replace(temporary, path)
+
+    def render(self):
+        # Write our own snapshot first so no file read is older than the last scrape
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            pid = data['pid']
+            alive = path == self._path(pid) and _is_alive(pid)
+            snapshots.append((pid if alive else None, data['metrics']))
+        return self.registry.render(snapshots)
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Process-wide registry used by the inference service
+metrics = MetricsRegistry()
+
+STAGE_LATENCY = metrics.histogram(
+    'duitguard_stage_latency_seconds',
+    'Time spent in each inference stage'
+)
@@ -0,0 +1,184 @@
+import gc
+import logging
+import os
+import select
+import signal
+import socket
+import time
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+
+class PreforkServer:
+    """Serve an ASGI app from N forked workers sharing one listening socket
+
+    Everything loaded before run() (the model bundle in particular) is shared
+    copy-on-write with the workers instead of being loaded once per worker.
+    The parent only supervises: it restarts workers that die and, when
+    reload_check() reports that a new model was activated in the parent,
+    replaces the workers one at a time so they pick up the new bundle while
+    the others keep serving.
+
+    A worker is ready once on_worker_start() returns, which it reports over
+    a pipe. An old worker is only stopped after its replacement is ready;
+    if a replacement fails or times out the roll stops and reload_failed()
+    is called, so the parent can go back to the previous bundle.
+    """
+
+    def __init__(self, app, host, port, workers, on_worker_start=None,
+                 reload_check=None, reload_interval=30.0, reload_failed=None, ready_timeout=300.0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.on_worker_start = on_worker_start
+        self.reload_check = reload_check
+        self.reload_interval = reload_interval
+        self.reload_failed = reload_failed
+        self.ready_timeout = ready_timeout
+        self._children = set()
+        self._stopping = False
+
+    def run(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+
+        logger.info(f"Starting {self.workers} workers on {self.host}:{self.port}")
+        self._freeze_shared_state()
+        for _ in range(self.workers):
+            os.close(self._spawn(sock)[1])
+
+        next_reload_check = time.monotonic() + self.reload_interval
+        while not self._stopping:
+            self._reap(sock)
+            if self.reload_check is not None and time.monotonic() >= next_reload_check:
+                next_reload_check = time.monotonic() + self.reload_interval
+                if self.reload_check():
+                    self._reload(sock)
+            time.sleep(0.5)
+
+        self._shutdown()
+        sock.close()
+
+    def _freeze_shared_state(self):
+        # Move everything allocated so far out of the collector's reach so
+        # workers don't write to (and copy) the shared model pages on GC
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+
+    def _spawn(self, sock):
+        """Fork a worker, returns its pid and the read end of its ready pipe"""
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                os.close(ready_read)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                if self.on_worker_start is not None:
+                    self.on_worker_start()
+                try:
+                    os.write(ready_write, b'1')
+                except OSError:
+                    # Nobody is waiting for this worker
+                    pass
+                os.close(ready_write)
+                config = uvicorn.Config(self.app, host=self.host, port=self.port)
+                uvicorn.Server(config).run(sockets=[sock])
+            except Exception:
+                logger.exception("Worker crashed")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+
+        os.close(ready_write)
+        self._children.add(pid)
+        return pid, ready_read
+
+    def _wait_ready(self, ready_read):
+        """True once the worker reported ready, False if it exited or timed out first"""
+        try:
+            readable, _, _ = select.select([ready_read], [], [], self.ready_timeout)
+            return bool(readable) and os.read(ready_read, 1) == b'1'
+        finally:
+            os.close(ready_read)
+
+    def _reap(self, sock):
+        """Collect exited workers and replace them"""
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self._children:
+                self._children.discard(pid)
+                if not self._stopping:
+                    logger.warning(f"Worker {pid} exited with status {status}, restarting")
+                    os.close(self._spawn(sock)[1])
+
+    def _reload(self, sock):
+        ready, replaced = self._rolling_restart(sock)
+        if ready:
+            return
+        if self.reload_failed is not None:
+            self.reload_failed()
+            if replaced:
+                # Workers replaced before the failure go back to the parent's bundle
+                self._rolling_restart(sock)
+
+    def _rolling_restart(self, sock):
+        """Replace workers one by one so capacity never drops to zero
+
+        Returns whether every replacement became ready and how many workers
+        were replaced. The old worker a failed replacement was meant for
+        keeps serving.
+        """
+        self._freeze_shared_state()
+        replaced = 0
+        for pid in list(self._children):
+            if self._stopping:
+                return True, replaced
+            new_pid, ready_read = self._spawn(sock)
+            if not self._wait_ready(ready_read):
+                logger.error(f"Replacement worker {new_pid} did not become ready, stopping the rolling restart")
+                self._children.discard(new_pid)
+                try:
+                    os.kill(new_pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                os.waitpid(new_pid, 0)
+                return False, replaced
+            self._children.discard(pid)
+            # uvicorn finishes in-flight requests before exiting on SIGTERM
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+            replaced += 1
+        return True, replaced
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _shutdown(self):
+        for pid in self._children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self._children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self._children.clear()
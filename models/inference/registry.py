@@ -0,0 +1,185 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+BUNDLE_FILES = ('model', 'scaler', 'label_encoder')
+
+
+class ModelRegistry:
+    """Local directory of versioned model bundles with atomic hot reload
+
+    Each bundle lives in <registry_dir>/<version>/ and is described by a
+    manifest.json naming its model, scaler and label encoder files. The
+    newest version (by name) is the active one. Bundles are loaded with
+    load_pipeline(model_path, scaler_path, encoder_path) and passed through
+    warmup(pipeline) before being swapped in, so requests never see a cold
+    or half-loaded pipeline.
+    """
+
+    def __init__(self, registry_dir, load_pipeline, warmup=None):
+        self.registry_dir = registry_dir
+        self.load_pipeline = load_pipeline
+        self.warmup = warmup
+        # (version, pipeline) is replaced as a whole so readers always get a
+        # consistent pair without locking
+        self._active = (None, None)
+        self._reload_lock = threading.Lock()
+        self._failed_versions = set()
+        self._stop_event = threading.Event()
+        self._watcher = None
+
+    @property
+    def version(self):
+        return self._active[0]
+
+    @property
+    def pipeline(self):
+        return self._active[1]
+
+    def active(self):
+        """Return the (version, pipeline) pair currently serving traffic"""
+        return self._active
+
+    def activate(self, version, pipeline):
+        """Swap in an already loaded pipeline"""
+        self._active = (version, pipeline)
+        logger.info(f"Serving model version {version}")
+
+    def mark_failed(self, version):
+        """Never activate version again, e.g. after it failed to warm up elsewhere"""
+        with self._reload_lock:
+            self._failed_versions.add(version)
+        logger.error(f"Model version {version} marked as failed")
+
+    def list_versions(self):
+        """List published versions, oldest first"""
+        if not os.path.isdir(self.registry_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.registry_dir)
+            if not name.startswith('.')
+            and os.path.isfile(os.path.join(self.registry_dir, name, MANIFEST_NAME))
+        )
+
+    def latest_version(self):
+        versions = self.list_versions()
+        return versions[-1] if versions else None
+
+    def read_manifest(self, version):
+        bundle_dir = os.path.join(self.registry_dir, version)
+        with open(os.path.join(bundle_dir, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+
+        missing = [key for key in BUNDLE_FILES if key not in manifest]
+        if missing:
+            raise ValueError(f"Manifest for version {version} is missing {missing}")
+        return manifest
+
+    def load(self, version, warm_up=True):
+        """Load and warm up the pipeline for a version without activating it"""
+        bundle_dir = os.path.join(self.registry_dir, version)
+        manifest = self.read_manifest(version)
+        pipeline = self.load_pipeline(
+            *(os.path.join(bundle_dir, manifest[key]) for key in BUNDLE_FILES)
+        )
+        if warm_up and self.warmup is not None:
+            self.warmup(pipeline)
+        return pipeline
+
+    def refresh(self, warm_up=True):
+        """Activate the latest version if it is not already serving
+
+        A version that fails to load or warm up is logged and not retried,
+        the current pipeline keeps serving. Returns the active version.
+        warm_up=False defers warm-up to the caller, e.g. a parent process that
+        must not start booster threads before forking workers.
+        """
+        with self._reload_lock:
+            latest = self.latest_version()
+            if latest is not None and latest != self.version and latest not in self._failed_versions:
+                try:
+                    pipeline = self.load(latest, warm_up=warm_up)
+                except Exception as e:
+                    logger.error(f"Failed to load model version {latest}: {str(e)}")
+                    self._failed_versions.add(latest)
+                else:
+                    self.activate(latest, pipeline)
+            return self.version
+
+    def start_watching(self, interval=30.0):
+        """Poll the registry in a background thread and hot swap new versions"""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop_event.clear()
+        self._watcher = threading.Thread(
+            target=self._watch, args=(interval,), name='model-registry-watcher', daemon=True
+        )
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self, interval):
+        while not self._stop_event.wait(interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Model registry refresh failed: {str(e)}")
+
+
+def publish_bundle(registry_dir, model_path, scaler_path, encoder_path, version=None):
+    """Copy model artifacts into a new registry version
+
+    The bundle is assembled in a hidden temporary directory and renamed into
+    place, so a watching service never sees a partial bundle.
+    """
+    version = version or datetime.now().strftime('%Y%m%d_%H%M%S')
+    bundle_dir = os.path.join(registry_dir, version)
+    if os.path.exists(bundle_dir):
+        raise FileExistsError(f"Model version {version} already exists in {registry_dir}")
+
+    staging_dir = os.path.join(registry_dir, f'.{version}.tmp')
+    os.makedirs(staging_dir)
+    try:
+        manifest = {
+            'version': version,
+            'created_at': datetime.now().isoformat(),
+        }
+        for key, path in zip(BUNDLE_FILES, (model_path, scaler_path, encoder_path)):
+            filename = f'{key}.joblib'
+            shutil.copy2(path, os.path.join(staging_dir, filename))
+            manifest[key] = filename
+            manifest[f'{key}_source'] = os.path.basename(path)
+
+        with open(os.path.join(staging_dir, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        os.rename(staging_dir, bundle_dir)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    return version
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish model artifacts to the local model registry")
+    parser.add_argument('model', help="xgb_model_*.joblib file")
+    parser.add_argument('scaler', help="scaler_*.joblib file")
+    parser.add_argument('label_encoder', help="label_encoder_*.joblib file")
+    parser.add_argument('--registry', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'registry'))
+    parser.add_argument('--version', default=None)
+    args = parser.parse_args()
+
+    published = publish_bundle(args.registry, args.model, args.scaler, args.label_encoder, version=args.version)
+    print(f"Published model version {published} to {args.registry}")
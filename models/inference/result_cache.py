@@ -0,0 +1,91 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import metrics
+
+# Default bucket width per raw feature, transactions whose features fall in
+# the same buckets share a cached result
+DEFAULT_BUCKET_WIDTHS = {
+    'TransactionAmount': 1.0,
+    'in_degree': 1,
+    'out_degree': 1,
+    'in_weight': 10.0,
+    'out_weight': 10.0,
+    'AvailableBalance': 10.0,
+}
+
+CACHE_HITS = metrics.counter('duitguard_cache_hits_total', 'Result cache hits')
+CACHE_MISSES = metrics.counter('duitguard_cache_misses_total', 'Result cache misses')
+
+
+def cache_hit_rate():
+    lookups = CACHE_HITS.value + CACHE_MISSES.value
+    return CACHE_HITS.value / lookups if lookups else 0.0
+
+
+CACHE_HIT_RATE = metrics.gauge('duitguard_cache_hit_rate', 'Result cache hit rate', callback=cache_hit_rate)
+
+
+def parse_bucket_widths(spec):
+    """Parse 'TransactionAmount=5,in_weight=100' into bucket width overrides"""
+    widths = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        feature, width = item.split('=')
+        widths[feature.strip()] = float(width)
+    return widths
+
+
+class ResultCache:
+    """Bounded TTL + LRU cache of scoring results keyed on quantized features
+
+    Keys combine the model version, the explain mode and the feature vector
+    floored into per-feature buckets, so retries and near-identical checks
+    reuse a result while a model reload naturally invalidates everything.
+    Keys are built from the resolved features, graph features filled in
+    from the feature store included, so a recorded transfer that moves an
+    account's features also moves its requests to a new key.
+    """
+
+    def __init__(self, feature_names, max_entries=10000, ttl_s=60.0, bucket_widths=None):
+        widths = {**DEFAULT_BUCKET_WIDTHS, **(bucket_widths or {})}
+        self.feature_names = tuple(feature_names)
+        self.widths = tuple(float(widths.get(feature, 1.0)) for feature in self.feature_names)
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, version, mode, transaction_data):
+        return (version, mode) + tuple(
+            math.floor(float(transaction_data.get(feature) or 0) / width)
+            for feature, width in zip(self.feature_names, self.widths)
+        )
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                CACHE_MISSES.inc()
+                return None
+            self._entries.move_to_end(key)
+        CACHE_HITS.inc()
+        return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_s, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
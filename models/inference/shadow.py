@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SHADOW_LATENCY = metrics.histogram(
+    'duitguard_shadow_latency_seconds',
+    'Time the shadow model spends per batch, next to the primary batch time'
+)
+SHADOW_ROWS = metrics.counter('duitguard_shadow_rows_total', 'Rows scored by the shadow model')
+SHADOW_AGREEMENTS = metrics.counter(
+    'duitguard_shadow_agreements_total', 'Shadow rows predicting the same class as the primary model'
+)
+SHADOW_DROPPED = metrics.counter(
+    'duitguard_shadow_dropped_total', 'Batches not shadow scored because the shadow queue was full'
+)
+
+
+class ShadowScorer:
+    """Score already answered batches with a candidate pipeline, off the request path
+
+    Batches go to a single background thread. At most max_pending batches
+    are queued or running; submit() drops anything beyond that instead of
+    waiting, so a slow candidate costs comparisons, never primary latency or
+    unbounded memory. Each batch logs the shadow and primary latency and how
+    often the two models agree.
+    """
+
+    def __init__(self, pipeline, name, max_pending=8):
+        self.pipeline = pipeline
+        self.name = name
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created on first use so pre-fork workers each start their own thread
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow')
+        return self._executor
+
+    def submit(self, transactions, primary_results, primary_seconds):
+        """Queue a scored batch for comparison, False if it was dropped"""
+        return self._submit(self._compare, transactions, primary_results, primary_seconds)
+
+    def submit_matrix(self, X, primary_columns, primary_seconds):
+        """Queue a raw feature matrix and the primary's format_columns() output, False if dropped
+
+        X must not be modified afterwards, pass a copy of a matrix the
+        primary scales in place.
+        """
+        return self._submit(self._compare_matrix, X, primary_columns, primary_seconds)
+
+    def _submit(self, compare, *args):
+        if not self._slots.acquire(blocking=False):
+            SHADOW_DROPPED.inc()
+            return False
+        try:
+            self._get_executor().submit(self._run, compare, *args)
+        except RuntimeError:
+            # Executor already shut down
+            self._slots.release()
+            return False
+        return True
+
+    def _run(self, compare, inputs, primary, primary_seconds):
+        try:
+            start = time.perf_counter()
+            n_rows, agreements, max_difference = compare(inputs, primary)
+            shadow_seconds = time.perf_counter() - start
+            SHADOW_LATENCY.observe(shadow_seconds, model=self.name)
+            SHADOW_ROWS.inc(n_rows)
+            SHADOW_AGREEMENTS.inc(agreements)
+
+            logger.info(
+                f"Shadow {self.name}: {agreements}/{n_rows} predictions agree, "
+                f"max probability difference {max_difference:.4f}, "
+                f"shadow {shadow_seconds * 1000:.2f} ms vs primary {primary_seconds * 1000:.2f} ms"
+            )
+        except Exception as e:
+            logger.error(f"Shadow scoring with {self.name} failed: {str(e)}")
+        finally:
+            self._slots.release()
+
+    def _compare(self, transactions, primary_results):
+        shadow_results = self.pipeline.predict_batch(transactions)
+        agreements = 0
+        max_difference = 0.0
+        for primary, shadow in zip(primary_results, shadow_results):
+            agreements += primary['prediction'] == shadow['prediction']
+            max_difference = max(max_difference, max(
+                abs(primary['probabilities'][class_name] - probability)
+                for class_name, probability in shadow['probabilities'].items()
+            ))
+        return len(shadow_results), agreements, max_difference
+
+    def _compare_matrix(self, X, primary_columns):
+        shadow_columns = self.pipeline.format_columns(self.pipeline.predict_proba_matrix(X))
+        agreements = int((primary_columns['prediction'] == shadow_columns['prediction']).sum())
+        max_difference = max(
+            float(np.abs(primary_columns[name] - shadow_columns[name]).max(initial=0.0))
+            for name in shadow_columns if name.startswith('prob_')
+        )
+        return len(X), agreements, max_difference
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
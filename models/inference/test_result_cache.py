@@ -0,0 +1,63 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('fastapi')
+pytest.importorskip('joblib')
+pytest.importorskip('xgboost')
+
+INFERENCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def inference(tmp_path, monkeypatch):
+    """xgboost-inference.py with the result cache on, serving the models directory's artifacts"""
+    monkeypatch.setenv('DUITGUARD_CACHE_SIZE', '100')
+    monkeypatch.setenv('DUITGUARD_MODEL_REGISTRY', str(tmp_path / 'registry'))
+    monkeypatch.setenv('DUITGUARD_TRANSACTIONS_PATH', str(tmp_path / 'transactions.csv'))
+    monkeypatch.syspath_prepend(INFERENCE_DIR)
+    spec = importlib.util.spec_from_file_location(
+        'xgboost_inference', os.path.join(INFERENCE_DIR, 'xgboost-inference.py')
+    )
+    module = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, 'xgboost_inference', module)
+    spec.loader.exec_module(module)
+
+    module.load_serving_pipeline(warm_up_modes=())
+    module.feature_store = module.AccountFeatureStore()
+    module.feature_store.add_transfers([('tx-0', 'ACC-1', 'ACC-3', 100.0)])
+    return module
+
+
+def score_account_only(inference, mode='fast'):
+    """Score a request carrying account ids but no graph features, as /predict does"""
+    transaction = inference.Transaction(
+        TransactionAmount=250.0, AvailableBalance=1200.0, AccountId='ACC-1', ToAccountId='ACC-2'
+    )
+    return inference.score_queued_transactions([(inference.resolve_transaction(transaction), mode, None)])[0]
+
+
+def cache_lookups():
+    from result_cache import CACHE_HITS, CACHE_MISSES
+    return CACHE_HITS.value, CACHE_MISSES.value
+
+
+def test_account_only_retries_hit_the_cache(inference):
+    hits, misses = cache_lookups()
+    results = [score_account_only(inference) for _ in range(5)]
+
+    assert cache_lookups() == (hits + 4, misses + 1)
+    assert all(result == results[0] for result in results)
+    assert results[0]['scoring_tier'] == 'fast'
+
+
+def test_recorded_transfer_moves_requests_to_a_new_key(inference):
+    score_account_only(inference)
+    inference.feature_store.add_transfers([('tx-1', 'ACC-1', 'ACC-4', 5000.0)])
+
+    hits, misses = cache_lookups()
+    score_account_only(inference)
+    assert cache_lookups() == (hits, misses + 1)
+    assert len(inference.result_cache) == 2
@@ -0,0 +1,258 @@
+import argparse
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ARRAY_NAMES = (
+    'split_feature', 'threshold', 'children', 'default_left',
+    'leaf_value', 'roots', 'tree_class', 'base_margin'
+)
+
+
+class TreeEnsemble:
+    """XGBoost trees flattened into contiguous NumPy arrays
+
+    Node i of every tree lives at position i of split_feature, threshold,
+    default_left and leaf_value, and its left and right children at
+    children[2 * i] and children[2 * i + 1]. Leaves point to themselves, so
+    walking all trees for all rows a fixed max_depth steps ends every path
+    on its leaf. One step is a handful of vectorized gathers over an
+    (n_rows, n_trees) node matrix. Trees are kept grouped by class in
+    boosting order, and each class margin is accumulated in that order in
+    float32 like the booster does.
+    """
+
+    def __init__(self, split_feature, threshold, children, default_left, leaf_value,
+                 roots, tree_class, base_margin, objective, max_depth):
+        self.split_feature = split_feature
+        self.threshold = threshold
+        self.children = children
+        self.default_left = default_left
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.tree_class = tree_class
+        self.base_margin = base_margin
+        self.objective = objective
+        self.max_depth = max_depth
+        self.n_classes = len(base_margin)
+        trees_per_class = np.bincount(tree_class, minlength=self.n_classes)
+        if (trees_per_class != trees_per_class[0]).any() or (np.diff(tree_class) < 0).any():
+            raise ValueError("Trees must be grouped by class with the same number per class")
+        self.trees_per_class = int(trees_per_class[0])
+
+    @classmethod
+    def from_booster(cls, booster, iteration_range=(0, 0)):
+        """Flatten the trees of a Booster, limited to iteration_range like Booster.predict"""
+        model = json.loads(booster.save_raw('json'))['learner']
+        objective = model['objective']['name']
+        trees_model = model['gradient_booster']['model']
+
+        tree_begin, tree_end = 0, len(trees_model['trees'])
+        begin, end = iteration_range
+        if end > 0:
+            iteration_indptr = trees_model['iteration_indptr']
+            tree_begin, tree_end = iteration_indptr[begin], iteration_indptr[end]
+        # Group the trees by class, keeping boosting order within a class
+        tree_class = np.asarray(trees_model['tree_info'][tree_begin:tree_end], dtype=np.int32)
+        order = np.argsort(tree_class, kind='stable')
+        trees = [trees_model['trees'][tree_begin + i] for i in order]
+        tree_class = tree_class[order]
+
+        split_feature, threshold, children, default_left, leaf_value, roots = [], [], [], [], [], []
+        max_depth = 0
+        offset = 0
+        for tree in trees:
+            if any(tree['split_type']):
+                raise ValueError("Categorical splits are not supported")
+            tree_left = np.asarray(tree['left_children'], dtype=np.int32)
+            tree_right = np.asarray(tree['right_children'], dtype=np.int32)
+            is_leaf = tree_left == -1
+            node_ids = np.arange(len(tree_left), dtype=np.int32)
+            conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+
+            roots.append(offset)
+            split_feature.append(np.where(is_leaf, 0, tree['split_indices']).astype(np.int32))
+            threshold.append(np.where(is_leaf, np.float32(0), conditions))
+            children.append(np.column_stack([
+                np.where(is_leaf, node_ids, tree_left),
+                np.where(is_leaf, node_ids, tree_right)
+            ]).ravel() + offset)
+            default_left.append(np.asarray(tree['default_left'], dtype=bool))
+            # Leaf values are stored in split_conditions
+            leaf_value.append(np.where(is_leaf, conditions, np.float32(0)))
+            max_depth = max(max_depth, _tree_depth(tree_left, tree_right))
+            offset += len(tree_left)
+
+        base_score = model['learner_model_param']['base_score']
+        n_classes = max(int(model['learner_model_param'].get('num_class', '0')), 1)
+        base_margin = np.asarray(json.loads(base_score) if base_score.startswith('[') else [float(base_score)],
+                                 dtype=np.float32)
+        if len(base_margin) != n_classes:
+            base_margin = np.full(n_classes, base_margin[0], dtype=np.float32)
+        if objective == 'binary:logistic':
+            # Stored as a probability, the trees add to its logit
+            base_margin = np.log(base_margin / (1 - base_margin)).astype(np.float32)
+
+        return cls(
+            split_feature=np.concatenate(split_feature),
+            threshold=np.concatenate(threshold).astype(np.float32),
+            children=np.concatenate(children).astype(np.int32),
+            default_left=np.concatenate(default_left),
+            leaf_value=np.concatenate(leaf_value).astype(np.float32),
+            roots=np.asarray(roots, dtype=np.int32),
+            tree_class=tree_class,
+            base_margin=base_margin,
+            objective=objective,
+            max_depth=max_depth
+        )
+
+    @classmethod
+    def from_model(cls, model):
+        """Flatten an XGBClassifier, limited to its best iteration like predict_proba"""
+        try:
+            iteration_range = (0, model.best_iteration + 1)
+        except AttributeError:
+            iteration_range = (0, 0)
+        return cls.from_booster(model.get_booster(), iteration_range)
+
+    def save(self, path):
+        np.savez(path, objective=self.objective, max_depth=self.max_depth,
+                 **{name: getattr(self, name) for name in ARRAY_NAMES})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(
+                objective=str(arrays['objective']),
+                max_depth=int(arrays['max_depth']),
+                **{name: arrays[name] for name in ARRAY_NAMES}
+            )
+
+    def leaf_values(self, X):
+        """(n_rows, n_trees) value of the leaf each row reaches in each tree"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.int32) * n_features)[:, None]
+        has_missing = np.isnan(flat).any()
+
+        nodes = np.repeat(self.roots[None, :], n_rows, axis=0)
+        for _ in range(self.max_depth):
+            values = flat[row_offsets + self.split_feature[nodes]]
+            go_right = values >= self.threshold[nodes]
+            if has_missing:
+                go_right |= np.isnan(values) & ~self.default_left[nodes]
+            nodes = self.children[2 * nodes + go_right]
+        return self.leaf_value[nodes]
+
+    def predict_margin(self, X):
+        """Raw margins, (n_rows, n_classes), summed in the booster's tree order"""
+        leaves = self.leaf_values(X).reshape(-1, self.n_classes, self.trees_per_class)
+        terms = np.empty((len(leaves), self.n_classes, self.trees_per_class + 1), dtype=np.float32)
+        terms[:, :, 0] = self.base_margin
+        terms[:, :, 1:] = leaves
+        # cumsum adds sequentially, a plain sum would reorder the float32 additions
+        return np.cumsum(terms, axis=2, dtype=np.float32)[:, :, -1]
+
+    def predict_proba(self, X):
+        """Class probabilities, (n_rows, n_classes) like XGBClassifier.predict_proba"""
+        margin = self.predict_margin(X)
+        if self.objective == 'binary:logistic':
+            p = 1.0 / (1.0 + np.exp(-margin[:, 0]))
+            return np.column_stack([1.0 - p, p])
+        # XGBClassifier applies scipy's softmax to multi:softmax margins
+        from scipy.special import softmax
+        return softmax(margin, axis=1)
+
+    def verify(self, model, X):
+        """Compare against the model on X, returns (margins_identical, probabilities_identical)"""
+        X = np.asarray(X, dtype=np.float32)
+        import xgboost as xgb
+
+        try:
+            iteration_range = (0, model.best_iteration + 1)
+        except AttributeError:
+            iteration_range = (0, 0)
+        booster_margin = model.get_booster().predict(
+            xgb.DMatrix(X), output_margin=True, iteration_range=iteration_range
+        ).reshape(len(X), -1)
+        margin = self.predict_margin(X)
+        booster_proba = model.predict_proba(X)
+        proba = self.predict_proba(X)
+
+        margins_identical = np.array_equal(margin, booster_margin)
+        probabilities_identical = np.array_equal(proba, booster_proba)
+        if not (margins_identical and probabilities_identical):
+            logger.warning(
+                f"Tree ensemble differs from the booster: max margin difference "
+                f"{np.abs(margin - booster_margin).max()}, max probability difference "
+                f"{np.abs(proba - booster_proba).max()}"
+            )
+        return margins_identical, probabilities_identical
+
+
+def _tree_depth(left, right):
+    """Number of splits on the longest root to leaf path"""
+    depth = 0
+    frontier = [0]
+    while True:
+        frontier = [child for node in frontier if left[node] != -1 for child in (left[node], right[node])]
+        if not frontier:
+            return depth
+        depth += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and verify NumPy tree ensembles of XGBoost models")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="Flatten xgb_model_*.joblib into an .npz file")
+    export_parser.add_argument('model', help="xgb_model_*.joblib file")
+    export_parser.add_argument('output', help=".npz file to write")
+
+    verify_parser = subparsers.add_parser('verify', help="Check an export against its booster")
+    verify_parser.add_argument('model', help="xgb_model_*.joblib file")
+    verify_parser.add_argument('ensemble', help=".npz file written by export")
+    verify_parser.add_argument('data', help="CSV of held-out rows")
+    verify_parser.add_argument('--scaler', default=None, help="scaler_*.joblib applied to the rows first")
+    verify_parser.add_argument('--features', nargs='*', default=None,
+                               help="Feature columns in model order, defaults to the scaler's")
+    args = parser.parse_args()
+
+    import joblib
+
+    model = joblib.load(args.model)
+    if args.command == 'export':
+        ensemble = TreeEnsemble.from_model(model)
+        ensemble.save(args.output)
+        logger.info(f"Exported {len(ensemble.roots)} trees ({len(ensemble.leaf_value)} nodes) to {args.output}")
+        return
+
+    import pandas as pd
+
+    ensemble = TreeEnsemble.load(args.ensemble)
+    scaler = joblib.load(args.scaler) if args.scaler else None
+    features = args.features or list(getattr(scaler, 'feature_names_in_', []))
+    data = pd.read_csv(args.data)
+    X = (data[features] if features else data).fillna(0).to_numpy(dtype=np.float32)
+    if scaler is not None:
+        X = ((X - scaler.mean_) / scaler.scale_).astype(np.float32)
+
+    margins_identical, probabilities_identical = ensemble.verify(model, X)
+    logger.info(
+        f"Verified {len(X)} rows: margins {'identical' if margins_identical else 'DIFFER'}, "
+        f"probabilities {'identical' if probabilities_identical else 'DIFFER'}"
+    )
+    raise SystemExit(0 if margins_identical and probabilities_identical else 1)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    main()
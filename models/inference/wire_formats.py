@@ -0,0 +1,86 @@
+import json
+
+import numpy as np
+
+# Supported request and response media types
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+
+_ALIASES = {
+    'application/x-msgpack': MSGPACK,
+    'application/vnd.msgpack': MSGPACK,
+    'application/x-apache-arrow-stream': ARROW_STREAM,
+}
+
+
+class UnsupportedMediaType(ValueError):
+    pass
+
+
+def media_type(header, default=JSON):
+    """Bare media type of a Content-Type value, without parameters"""
+    if not header:
+        return default
+    media = header.split(';', 1)[0].strip().lower()
+    return _ALIASES.get(media, media)
+
+
+def negotiate(accept, request_type, supported):
+    """Response media type: the first supported type in Accept, else the request's"""
+    for part in (accept or '').split(','):
+        media = media_type(part, default=None)
+        if media in supported:
+            return media
+    return request_type if request_type in supported else JSON
+
+
+def decode_object(body, content_type):
+    """Decode a single JSON or MessagePack request body"""
+    if content_type == MSGPACK:
+        try:
+            import msgpack
+        except ImportError:
+            raise UnsupportedMediaType("MessagePack requests need the msgpack package")
+        return msgpack.unpackb(body, raw=False)
+    if content_type == JSON:
+        return json.loads(body)
+    raise UnsupportedMediaType(f"Unsupported content type '{content_type}'")
+
+
+def encode_object(obj, content_type):
+    if content_type == MSGPACK:
+        import msgpack
+        return msgpack.packb(obj, use_bin_type=True)
+    return json.dumps(obj).encode()
+
+
+def read_arrow_table(body):
+    """Read every record batch of an Arrow IPC stream into one table"""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise UnsupportedMediaType("Arrow requests need the pyarrow package")
+    return pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+
+
+def table_to_matrix(table, feature_names):
+    """float32 matrix of the named columns, NaN where a value is null or the column absent"""
+    import pyarrow as pa
+
+    X = np.full((table.num_rows, len(feature_names)), np.nan, dtype=np.float32)
+    for j, feature in enumerate(feature_names):
+        if feature in table.column_names:
+            X[:, j] = table.column(feature).cast(pa.float64()).to_numpy()
+    return X
+
+
+def encode_arrow(columns):
+    """Serialize a dict of equal-length arrays as an Arrow IPC stream"""
+    import pyarrow as pa
+
+    table = pa.table(columns)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
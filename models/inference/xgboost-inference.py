@@ -1,153 +1,457 @@
-import joblib
-import pandas as pd
+import time
+STARTUP_STARTED = time.monotonic()
+
+import asyncio
 import numpy as np
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse
+from pydantic import ValidationError
 from pydantic import BaseModel
+from typing import Literal, Optional
 import uvicorn
+import argparse
 import glob
 import os
+import tempfile
+import threading
+import logging
 from fastapi.middleware.cors import CORSMiddleware
-import shap 
+from fastapi.concurrency import run_in_threadpool
+from batching import MicroBatcher
+from registry import ModelRegistry
+from prefork import PreforkServer
+from metrics import metrics, MultiprocessMetrics, STAGE_LATENCY
+from feature_store import AccountFeatureStore, GRAPH_FEATURES
+from result_cache import ResultCache, parse_bucket_widths
+from shadow import ShadowScorer
+from tree_ensemble import TreeEnsemble
+import wire_formats
+
+# joblib, xgboost and shap are imported when the first pipeline loads (shap
+# only when an explainer is first needed) so importing this module stays fast
+
+# Explanation tiers, the deployment default can be overridden per request
+EXPLAIN_MODES = ('none', 'fast', 'full')
+EXPLAIN_MODE = os.environ.get('DUITGUARD_EXPLAIN_MODE', 'full')
+if EXPLAIN_MODE not in EXPLAIN_MODES:
+    raise ValueError(f"DUITGUARD_EXPLAIN_MODE must be one of {EXPLAIN_MODES}, got '{EXPLAIN_MODE}'")
+
+# Build the SHAP explainer in the background once serving, instead of
+# before reporting ready. Until it is built, 'full' requests are scored as
+# 'fast' and say so in scoring_tier.
+LAZY_EXPLAINER = os.environ.get('DUITGUARD_LAZY_EXPLAINER', '1') == '1'
+
+# Model artifacts and the versioned registry watched for hot reloads
+MODEL_DIR = os.environ.get(
+    'DUITGUARD_MODEL_DIR',
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+MODEL_REGISTRY_DIR = os.environ.get('DUITGUARD_MODEL_REGISTRY', os.path.join(MODEL_DIR, 'registry'))
+RELOAD_INTERVAL_S = float(os.environ.get('DUITGUARD_RELOAD_INTERVAL_S', '30'))
+
+# Transaction history the online feature store is built from
+TRANSACTIONS_PATH = os.environ.get(
+    'DUITGUARD_TRANSACTIONS_PATH',
+    os.path.join(os.path.dirname(MODEL_DIR), 'data', 'v3.2', 'train_transactions.csv')
+)
+
+# Micro-batching of concurrent /predict requests
+BATCH_WINDOW_MS = float(os.environ.get('DUITGUARD_BATCH_WINDOW_MS', '2'))
+BATCH_MAX_SIZE = int(os.environ.get('DUITGUARD_BATCH_MAX_SIZE', '64'))
+
+# Result cache in front of the pipeline, disabled when the size is 0
+CACHE_SIZE = int(os.environ.get('DUITGUARD_CACHE_SIZE', '0'))
+CACHE_TTL_S = float(os.environ.get('DUITGUARD_CACHE_TTL_S', '60'))
+CACHE_BUCKETS = os.environ.get('DUITGUARD_CACHE_BUCKETS', '')
+
+# Batches up to this many rows are scored by walking the trees in NumPy
+# instead of calling the booster, 0 to always use the booster
+NUMPY_TREES_MAX_ROWS = int(os.environ.get('DUITGUARD_NUMPY_TREES_MAX_ROWS', '4'))
+
+# Per-request latency budget for /predict, overridden by the X-Deadline-Ms
+# header, 0 for none. SHAP is skipped once less than SHAP_BUDGET_MS is left
+# and the account's precomputed risk is returned once the deadline passed.
+DEADLINE_MS = float(os.environ.get('DUITGUARD_DEADLINE_MS', '0'))
+SHAP_BUDGET_MS = float(os.environ.get('DUITGUARD_SHAP_BUDGET_MS', '25'))
+
+# Where pre-fork workers share metric snapshots so /metrics reports all
+# of them, a fresh temporary directory when empty
+METRICS_DIR = os.environ.get('DUITGUARD_METRICS_DIR', '')
+
+# Candidate model (a directory of sample2.py artifacts) scored on live
+# traffic in the background for comparison, off when empty
+SHADOW_MODEL_DIR = os.environ.get('DUITGUARD_SHADOW_MODEL_DIR', '')
+SHADOW_MAX_PENDING = int(os.environ.get('DUITGUARD_SHADOW_MAX_PENDING', '8'))
+
+# Labels of the classes that are not fraud, e.g. sample2.py's fillna('no_fraud')
+LEGITIMATE_CLASSES = ('no_fraud', 'legitimate')
+
+# Model input features, in training order
+FEATURE_NAMES = (
+    'TransactionAmount', 'in_degree', 'out_degree',
+    'in_weight', 'out_weight', 'AvailableBalance'
+)
 
 class FraudDetectionPipeline:
     def __init__(self, model_path, scaler_path, encoder_path):
         """Initialize the pipeline with saved model artifacts"""
+        import joblib
+        import xgboost as xgb
+
         self.model = joblib.load(model_path)
         self.scaler = joblib.load(scaler_path)
         self.label_encoder = joblib.load(encoder_path)
-        # Initialize SHAP explainer
-        self.explainer = shap.TreeExplainer(self.model)
-        self.feature_names = [
-            'TransactionAmount', 'in_degree', 'out_degree',
-            'in_weight', 'out_weight', 'AvailableBalance'
-        ]
-        
+        self._DMatrix = xgb.DMatrix
+        # SHAP explainer is built on first use, see explainer
+        self._explainer = None
+        self._explainer_lock = threading.Lock()
+        self.feature_names = list(FEATURE_NAMES)
+
+        # Precompute scaler vectors and class names for the hot path
+        n_features = len(self.feature_names)
+        self._scaler_mean = (
+            self.scaler.mean_.astype(np.float32) if self.scaler.with_mean
+            else np.zeros(n_features, dtype=np.float32)
+        )
+        self._scaler_scale = (
+            self.scaler.scale_.astype(np.float32) if self.scaler.with_std
+            else np.ones(n_features, dtype=np.float32)
+        )
+        self.class_names = tuple(str(c) for c in self.label_encoder.classes_)
+        self.fraud_classes = tuple(c for c in self.class_names if c not in LEGITIMATE_CLASSES)
+
+        # Native booster for 'fast' explanations, limited to the best iteration
+        # like XGBClassifier.predict_proba
+        self.booster = self.model.get_booster()
+        try:
+            self._iteration_range = (0, self.model.best_iteration + 1)
+        except AttributeError:
+            self._iteration_range = (0, 0)
+
+        # Preallocated feature row, one per serving thread
+        self._local = threading.local()
+
+        # Flattened trees for small batches, only used once verify_ensemble()
+        # found them to match the booster. Verifying calls the booster, whose
+        # threads must not start before a pre-fork parent forks, so it runs
+        # in warm_up() instead of here.
+        self.ensemble = None
+        self._unverified_ensemble = self._compile_ensemble() if NUMPY_TREES_MAX_ROWS > 0 else None
+
+    def _compile_ensemble(self):
+        """Flatten the trees, None if the model can't be evaluated in NumPy"""
+        try:
+            return TreeEnsemble.from_model(self.model)
+        except (ValueError, KeyError) as e:
+            logging.warning(f"NumPy tree evaluation unavailable: {str(e)}")
+            return None
+
+    def verify_ensemble(self):
+        """Start using the flattened trees if they match the booster exactly"""
+        ensemble, self._unverified_ensemble = self._unverified_ensemble, None
+        if ensemble is None:
+            return
+        # Inputs are standardized, so standard normal rows cover the split range
+        X = np.random.default_rng(0).standard_normal((256, len(self.feature_names))).astype(np.float32)
+        if not all(ensemble.verify(self.model, X)):
+            logging.warning("NumPy tree evaluation disagrees with the booster, not using it")
+            return
+        self.ensemble = ensemble
+
+    def _predict_proba(self, X_processed):
+        """predict_proba, walking the trees in NumPy for small batches"""
+        if self.ensemble is not None and len(X_processed) <= NUMPY_TREES_MAX_ROWS:
+            return self.ensemble.predict_proba(X_processed)
+        return self.model.predict_proba(X_processed)
+
+    def _scale(self, X):
+        """Apply the fitted StandardScaler in place"""
+        X -= self._scaler_mean
+        X /= self._scaler_scale
+        return X
+
+    def _format_prediction(self, pred_proba):
+        """Build the prediction response from one row of class probabilities"""
+        pred_idx = int(pred_proba.argmax())
+        return {
+            'prediction': self.class_names[pred_idx],
+            'confidence': float(pred_proba[pred_idx]),
+            'probabilities': dict(zip(self.class_names, pred_proba.tolist()))
+        }
+
     def preprocess_transaction(self, transaction_data):
-        """Preprocess single transaction"""
-        # Expected features in correct order
-        required_features = [
-            'TransactionAmount', 'in_degree', 'out_degree',
-            'in_weight', 'out_weight', 'AvailableBalance'
-        ]
-        
-        # Ensure all features exist
-        for feature in required_features:
-            if feature not in transaction_data:
-                transaction_data[feature] = 0
-                
-        # Create feature vector
-        X = pd.DataFrame([transaction_data])[required_features]
-        
-        # Scale features
-        X_scaled = self.scaler.transform(X)
-        
-        return X_scaled
-    
+        """Preprocess single transaction
+
+        Returns a scaled (1, n_features) row backed by a per-thread buffer,
+        valid until the next call on the same thread.
+        """
+        with STAGE_LATENCY.time(stage='preprocess'):
+            row = getattr(self._local, 'row', None)
+            if row is None:
+                row = self._local.row = np.empty((1, len(self.feature_names)), dtype=np.float32)
+
+            # Missing features default to 0
+            values = row[0]
+            for i, feature in enumerate(self.feature_names):
+                values[i] = transaction_data.get(feature, 0)
+
+            return self._scale(row)
+
     def predict(self, transaction_data):
         """Make prediction for single transaction"""
-        # Preprocess
         X_processed = self.preprocess_transaction(transaction_data)
-        
-        # Predict
-        pred_encoded = self.model.predict(X_processed)[0]
-        
-        # Decode prediction
-        pred_label = self.label_encoder.inverse_transform([pred_encoded])[0]
-        
-        # Get prediction probabilities
-        pred_proba = self.model.predict_proba(X_processed)[0]
-        
-        return {
-            'prediction': pred_label,
-            'confidence': float(max(pred_proba)),
-            'probabilities': {
-                self.label_encoder.inverse_transform([i])[0]: float(p)
-                for i, p in enumerate(pred_proba)
-            }
+
+        # Single booster call, label is the most probable class
+        with STAGE_LATENCY.time(stage='predict_proba'):
+            pred_proba = self._predict_proba(X_processed)[0]
+
+        return self._format_prediction(pred_proba)
+
+    def build_feature_matrix(self, transactions):
+        """Build a float32 feature matrix for a batch of transactions"""
+        X = np.zeros((len(transactions), len(self.feature_names)), dtype=np.float32)
+        for row, transaction_data in enumerate(transactions):
+            X[row] = [transaction_data.get(feature, 0) for feature in self.feature_names]
+        return X
+
+    def predict_batch(self, transactions):
+        """Make predictions for a batch of transactions in one model call"""
+        if len(transactions) == 0:
+            return []
+
+        with STAGE_LATENCY.time(stage='preprocess'):
+            X = self.build_feature_matrix(transactions)
+        pred_proba = self.predict_proba_matrix(X)
+
+        return [self._format_prediction(row) for row in pred_proba]
+
+    def format_columns(self, pred_proba):
+        """Columnar predictions for a probability matrix, without a dict per row"""
+        pred_idx = pred_proba.argmax(axis=1)
+        columns = {
+            'prediction': np.array(self.class_names, dtype=object)[pred_idx],
+            'confidence': pred_proba[np.arange(len(pred_idx)), pred_idx],
         }
+        for i, class_name in enumerate(self.class_names):
+            columns[f'prob_{class_name}'] = pred_proba[:, i]
+        return columns
+
+    def predict_proba_matrix(self, X):
+        """Class probabilities for a raw (n_rows, n_features) matrix in feature_names order
+
+        X is scaled in place when it is already float32.
+        """
+        # Scale the whole batch at once
+        with STAGE_LATENCY.time(stage='preprocess'):
+            X_scaled = self._scale(np.asarray(X, dtype=np.float32))
+
+        # Single booster call, label is the most probable class
+        with STAGE_LATENCY.time(stage='predict_proba'):
+            return self._predict_proba(X_scaled)
+
+    def set_threads(self, n_threads):
+        """Limit the booster's thread pool, e.g. to one share of the cores per worker"""
+        self.model.n_jobs = n_threads
+        self.booster.set_param('nthread', n_threads)
+
+    @property
+    def explainer(self):
+        """SHAP TreeExplainer, imported and built on first access"""
+        if self._explainer is None:
+            with self._explainer_lock:
+                if self._explainer is None:
+                    with STAGE_LATENCY.time(stage='explainer_init'):
+                        import shap
+                        self._explainer = shap.TreeExplainer(self.model)
+        return self._explainer
+
+    @property
+    def explainer_ready(self):
+        """Whether full explanations can run without building the explainer first"""
+        return self._explainer is not None
+
+    def prepare_explainer_async(self):
+        """Build the explainer and warm up full explanations on a background thread"""
+        thread = threading.Thread(
+            target=self.warm_up, kwargs={'modes': ('full',)}, name='explainer-warm-up', daemon=True
+        )
+        thread.start()
+        return thread
+
+    def warm_up(self, n_rows=8, modes=EXPLAIN_MODES):
+        """Run synthetic transactions through the given explain modes
+
+        Pays the booster and explainer first-call costs before the pipeline
+        takes traffic, and verifies the NumPy tree evaluator on first call.
+        """
+        self.verify_ensemble()
+        rng = np.random.default_rng(0)
+        rows = rng.normal(
+            self._scaler_mean, self._scaler_scale, size=(n_rows, len(self.feature_names))
+        ).clip(min=0)
+        transactions = [dict(zip(self.feature_names, row)) for row in rows.tolist()]
+
+        self.predict(transactions[0])
+        for mode in modes:
+            self.explain_batch(transactions, mode=mode)
     
-    def explain_prediction(self, transaction_data):
-        """Generate SHAP explanation for highest probability fraud class"""
-        try:
-            # Get prediction and probabilities
-            result = self.predict(transaction_data)
-            X_processed = self.preprocess_transaction(transaction_data)
-            
-            # Ensure X_processed is 2D
-            if len(X_processed.shape) == 1:
-                X_processed = X_processed.reshape(1, -1)
-                
-            # Get SHAP values with shape validation
-            shap_values = self.explainer.shap_values(X_processed)
-            
-            # Debug logging
-            print(f"SHAP values shape: {np.array(shap_values).shape}")
-            print(f"Available classes: {self.label_encoder.classes_}")
-            
-            # Find highest probability non-legitimate class
-            fraud_classes = [cls for cls in result['probabilities'].keys() if cls != 'legitimate']
-            if not fraud_classes:
-                return result
-                
-            fraud_probs = {cls: result['probabilities'][cls] for cls in fraud_classes}
-            highest_fraud_class = max(fraud_probs.items(), key=lambda x: x[1])[0]
-            
-            # Safe class index extraction
-            class_idx = int(self.label_encoder.transform([highest_fraud_class])[0])
-            
-            # Handle different SHAP value formats
-            if isinstance(shap_values, list):
-                # Multi-class case
-                if class_idx >= len(shap_values):
-                    print(f"Warning: class_idx {class_idx} out of bounds, using first class")
-                    class_idx = 0
-                class_shap_values = shap_values[class_idx]
-                if len(class_shap_values.shape) > 1:
-                    class_shap_values = class_shap_values[0]
-            else:
-                # Binary case
-                class_shap_values = shap_values[0] if len(shap_values.shape) > 1 else shap_values
-                
-            # Safe feature importance calculation
-            feature_importance = {}
-            for feature, value in zip(self.feature_names, class_shap_values):
-                if isinstance(value, np.ndarray):
-                    value = float(value.item()) if value.size == 1 else float(value[0])
-                else:
-                    value = float(value)
-                feature_importance[feature] = value
-            
-            # Update risk factors with context
-            explanation = {
-                **result,
-                'fraud_class_explained': highest_fraud_class,
-                'fraud_probability': float(result['probabilities'][highest_fraud_class]),
-                'risk_factors': [
-                    {
-                        'feature': feature,
-                        'impact': float(value),
-                        'interpretation': self._get_feature_interpretation(
-                            feature, 
-                            float(value),
-                            transaction_data
-                        )
-                    }
-                    for feature, value in sorted(
-                        feature_importance.items(),
-                        key=lambda x: abs(x[1]),
-                        reverse=True
-                    )[:3]
-                ]
-            }
-            
-            return explanation
-            
-        except Exception as e:
-            print(f"Error in explain_prediction: {str(e)}")
-            print(f"SHAP values type: {type(shap_values)}")
-            if isinstance(shap_values, list):
-                print(f"Number of classes in SHAP values: {len(shap_values)}")
-            raise
+    def explain_prediction(self, transaction_data, mode='full'):
+        """Predict and explain the highest probability fraud class
+
+        mode is one of EXPLAIN_MODES: 'none' skips the explanation, 'fast' uses
+        XGBoost's native feature contributions and 'full' runs SHAP.
+        """
+        X_processed = self.preprocess_transaction(transaction_data)
+        return self.explain_processed(X_processed, [transaction_data], mode=mode)[0]
+
+    def explain_batch(self, transactions, mode='full', explain_by=None):
+        """Predict and explain a batch of transactions with one model call per stage"""
+        if len(transactions) == 0:
+            return []
+
+        with STAGE_LATENCY.time(stage='preprocess'):
+            X_processed = self._scale(self.build_feature_matrix(transactions))
+        return self.explain_processed(X_processed, transactions, mode=mode, explain_by=explain_by)
+
+    def explain_processed(self, X_processed, transactions, mode='full', pred_proba=None, explain_by=None):
+        """Explain already scaled rows, one per transaction
+
+        pred_proba can be passed in when the probabilities are already known,
+        so the 'none' and 'full' modes skip the extra model call. explain_by
+        holds a time.monotonic() cutoff (or None) per row: rows whose cutoff
+        has passed once the probabilities are known skip SHAP and get only
+        the probabilities.
+        """
+        if mode not in EXPLAIN_MODES:
+            raise ValueError(f"Unknown explain mode '{mode}', expected one of {EXPLAIN_MODES}")
+
+        if mode == 'fast':
+            # Probabilities and contributions come from the same booster call
+            with STAGE_LATENCY.time(stage='contributions'):
+                pred_proba, contributions = self._native_contributions(X_processed)
+        else:
+            if pred_proba is None:
+                with STAGE_LATENCY.time(stage='predict_proba'):
+                    pred_proba = self._predict_proba(X_processed)
+            if mode == 'none':
+                return [self._format_prediction(row) for row in pred_proba]
+            if explain_by is not None:
+                now = time.monotonic()
+                late = [by is not None and now > by for by in explain_by]
+                if any(late):
+                    return self._explain_in_time(X_processed, transactions, mode, pred_proba, late)
+            with STAGE_LATENCY.time(stage='shap'):
+                contributions = self._shap_contributions(X_processed)
+
+        with STAGE_LATENCY.time(stage='interpretation'):
+            return [
+                self._build_explanation(self._format_prediction(row_proba), row_contributions, transaction_data)
+                for row_proba, row_contributions, transaction_data
+                in zip(pred_proba, contributions, transactions)
+            ]
+
+    def _explain_in_time(self, X_processed, transactions, mode, pred_proba, late):
+        """Explain the rows that are not late, probabilities only for the others"""
+        results = [self._format_prediction(row) for row in pred_proba]
+        rows = [i for i, is_late in enumerate(late) if not is_late]
+        if rows:
+            explained = self.explain_processed(
+                X_processed[rows], [transactions[i] for i in rows], mode=mode, pred_proba=pred_proba[rows]
+            )
+            for i, result in zip(rows, explained):
+                results[i] = result
+        return results
+
+    def reinterpret(self, result, transaction_data):
+        """Copy of a cached result with risk factor interpretations for this transaction"""
+        if 'risk_factors' not in result:
+            return result
+        return {
+            **result,
+            'risk_factors': [
+                {
+                    **factor,
+                    'interpretation': self._get_feature_interpretation(
+                        factor['feature'], factor['impact'], transaction_data
+                    )
+                }
+                for factor in result['risk_factors']
+            ]
+        }
+
+    def _native_contributions(self, X_processed):
+        """Get class probabilities and (n_rows, n_classes, n_features) contributions from the booster"""
+        contribs = self.booster.predict(
+            self._DMatrix(X_processed),
+            pred_contribs=True,
+            iteration_range=self._iteration_range
+        )
+
+        # The last column is the bias term, rows sum to the raw margin
+        if contribs.ndim == 2:
+            # Binary case: one margin for the positive class
+            p = 1.0 / (1.0 + np.exp(-contribs.sum(axis=1)))
+            pred_proba = np.column_stack([1.0 - p, p])
+            contributions = np.stack([-contribs[:, :-1], contribs[:, :-1]], axis=1)
+        else:
+            margins = contribs.sum(axis=2)
+            exp_margins = np.exp(margins - margins.max(axis=1, keepdims=True))
+            pred_proba = exp_margins / exp_margins.sum(axis=1, keepdims=True)
+            contributions = contribs[:, :, :-1]
+
+        return pred_proba, contributions
+
+    def _shap_contributions(self, X_processed):
+        """Get SHAP values as a (n_rows, n_classes, n_features) array"""
+        shap_values = self.explainer.shap_values(X_processed)
+
+        # Handle different SHAP value formats
+        if isinstance(shap_values, list):
+            # Multi-class case, one (n_rows, n_features) array per class
+            return np.stack(shap_values, axis=1)
+        if shap_values.ndim == 3:
+            # Multi-class case, (n_rows, n_features, n_classes)
+            return shap_values.transpose(0, 2, 1)
+        # Binary case, values are for the positive class
+        return np.stack([-shap_values, shap_values], axis=1)
+
+    def _build_explanation(self, result, contributions, transaction_data):
+        """Attach top risk factors for the highest probability fraud class"""
+        # Find highest probability fraud class, no_fraud and the like excluded
+        if not self.fraud_classes:
+            return result
+
+        fraud_probs = {cls: result['probabilities'][cls] for cls in self.fraud_classes}
+        highest_fraud_class = max(fraud_probs.items(), key=lambda x: x[1])[0]
+        class_idx = self.class_names.index(highest_fraud_class)
+
+        feature_importance = dict(zip(self.feature_names, contributions[class_idx].tolist()))
+
+        # Update risk factors with context
+        explanation = {
+            **result,
+            'fraud_class_explained': highest_fraud_class,
+            'fraud_probability': float(result['probabilities'][highest_fraud_class]),
+            'risk_factors': [
+                {
+                    'feature': feature,
+                    'impact': float(value),
+                    'interpretation': self._get_feature_interpretation(
+                        feature, 
+                        float(value),
+                        transaction_data
+                    )
+                }
+                for feature, value in sorted(
+                    feature_importance.items(),
+                    key=lambda x: abs(x[1]),
+                    reverse=True
+                )[:3]
+            ]
+        }
+
+        return explanation
             
     def _get_feature_interpretation(self, feature, shap_value, transaction_data):
         """Generate context-aware interpretation of SHAP values"""
@@ -165,7 +469,7 @@ class FraudDetectionPipeline:
         }
         
         # Context-aware interpretations
-        value = transaction_data[feature]
+        value = transaction_data.get(feature, 0)
         threshold = thresholds[feature]
         
         interpretations = {
@@ -205,16 +509,13 @@ class FraudDetectionPipeline:
 
 
 # Example usage:
-def load_fraud_detection_pipeline(model_dir='models'):
+def load_fraud_detection_pipeline(model_dir=MODEL_DIR):
     """Load latest model files"""
     
     # Get latest model files
-    # model_files = glob.glob(os.path.join(model_dir, 'xgb_model_*.joblib'))
-    # scaler_files = glob.glob(os.path.join(model_dir, 'scaler_*.joblib'))
-    # encoder_files = glob.glob(os.path.join(model_dir, 'label_encoder_*.joblib'))
-    model_files = glob.glob(r"C:\Users\ILLEGEAR\Desktop\Projects\duitguard\models\xgb_model_20241201_083843.joblib")
-    scaler_files = glob.glob(r"C:\Users\ILLEGEAR\Desktop\Projects\duitguard\models\scaler_20241201_083843.joblib")
-    encoder_files = glob.glob(r"C:\Users\ILLEGEAR\Desktop\Projects\duitguard\models\label_encoder_20241201_083843.joblib")
+    model_files = glob.glob(os.path.join(model_dir, 'xgb_model_*.joblib'))
+    scaler_files = glob.glob(os.path.join(model_dir, 'scaler_*.joblib'))
+    encoder_files = glob.glob(os.path.join(model_dir, 'label_encoder_*.joblib'))
     
     if not model_files:
         raise FileNotFoundError("No model files found in the specified directory.")
@@ -229,17 +530,79 @@ def load_fraud_detection_pipeline(model_dir='models'):
     
     return FraudDetectionPipeline(latest_model, latest_scaler, latest_encoder)
 
-# Load the pipeline
-pipeline = load_fraud_detection_pipeline()
+# Serving pipeline, preferring the newest registry bundle
+registry = ModelRegistry(
+    MODEL_REGISTRY_DIR,
+    FraudDetectionPipeline,
+    warmup=lambda pipeline: pipeline.warm_up()
+)
+
+# Set in pre-fork workers, whose model reloads are driven by the parent
+prefork_worker = False
+
+# Metrics summed over pre-fork workers, set by serve() when forking
+multiprocess_metrics = None
+
+# Set once the serving pipeline is loaded and warmed up
+ready = threading.Event()
+
+STARTUP_SECONDS = metrics.gauge('duitguard_startup_seconds', 'Seconds from import until ready to serve')
+READY = metrics.gauge('duitguard_ready', 'Whether the service is ready to serve', callback=ready.is_set)
+
+def load_serving_pipeline(warm_up_modes=EXPLAIN_MODES):
+    """Activate the newest registry bundle, falling back to the models directory
+
+    Only called before the service reports ready, so the pipeline can be
+    warmed up after it is activated.
+    """
+    if registry.refresh(warm_up=False) is None:
+        # Nothing published yet, serve the latest artifacts in the models directory
+        registry.activate('legacy', load_fraud_detection_pipeline())
+    if warm_up_modes:
+        registry.pipeline.warm_up(modes=warm_up_modes)
+
+def mark_ready():
+    STARTUP_SECONDS.set(time.monotonic() - STARTUP_STARTED)
+    ready.set()
+    logging.info(f"Ready to serve model version {registry.version}")
+
+def start_up():
+    """Load, warm up and report ready, with SHAP optionally left to the background"""
+    try:
+        load_serving_pipeline(warm_up_modes=('none', 'fast') if LAZY_EXPLAINER else EXPLAIN_MODES)
+        load_feature_store()
+        mark_ready()
+        load_shadow()
+        if LAZY_EXPLAINER:
+            registry.pipeline.prepare_explainer_async()
+    except Exception:
+        logging.exception("Startup failed")
+        raise
+
+def require_ready():
+    if not ready.is_set():
+        raise HTTPException(status_code=503, detail="Model is loading")
+
+ExplainMode = Literal['none', 'fast', 'full']
 
 # Define the request body
 class Transaction(BaseModel):
     TransactionAmount: float
-    in_degree: int
-    out_degree: int
-    in_weight: float
-    out_weight: float
     AvailableBalance: float
+    # Sender and receiver, graph features left out are read from the feature store
+    AccountId: Optional[str] = None
+    ToAccountId: Optional[str] = None
+    in_degree: Optional[int] = None
+    out_degree: Optional[int] = None
+    in_weight: Optional[float] = None
+    out_weight: Optional[float] = None
+
+# A transfer that went through, reported once it settles
+class Transfer(BaseModel):
+    TransactionId: str
+    AccountId: str
+    ToAccountId: str
+    TransactionAmount: float
 
 def explain_prediction(self, transaction_data):
         result = self.predict(transaction_data)
@@ -254,6 +617,204 @@ def explain_prediction(self, transaction_data):
             'risk_factors': risk_factors
         }
 
+# Online per-account graph features, replaced by load_feature_store() before
+# the service reports ready. Pre-fork workers each inherit a private copy,
+# so there it is read-only: /transfers is refused and model scores are not
+# blended into the account risk, keeping every worker's answers the same.
+feature_store = AccountFeatureStore()
+
+def load_feature_store():
+    """Build the feature store from the transaction history, if there is one"""
+    global feature_store
+    if not os.path.exists(TRANSACTIONS_PATH):
+        logging.warning(f"No transaction history at {TRANSACTIONS_PATH}, feature store starts empty")
+        return
+    feature_store = AccountFeatureStore.from_csv(TRANSACTIONS_PATH)
+
+# Background comparison against a candidate model, set by load_shadow()
+shadow = None
+
+def load_shadow():
+    """Load the candidate model from SHADOW_MODEL_DIR, if one is configured"""
+    global shadow
+    if not SHADOW_MODEL_DIR:
+        return
+    try:
+        pipeline = load_fraud_detection_pipeline(SHADOW_MODEL_DIR)
+    except Exception as e:
+        logging.error(f"Failed to load shadow model from {SHADOW_MODEL_DIR}: {str(e)}")
+        return
+    # One booster thread so the candidate never competes with the primary for cores
+    pipeline.set_threads(1)
+    shadow = ShadowScorer(
+        pipeline,
+        name=os.path.basename(os.path.normpath(SHADOW_MODEL_DIR)),
+        max_pending=SHADOW_MAX_PENDING
+    )
+    logging.info(f"Shadow scoring with the model in {SHADOW_MODEL_DIR}")
+
+def shadow_score(transactions, results, primary_seconds):
+    """Hand a scored batch to the shadow model, skipping rows without probabilities"""
+    if shadow is None:
+        return
+    scored = [(transaction, result) for transaction, result in zip(transactions, results) if 'probabilities' in result]
+    if scored:
+        shadow.submit([transaction for transaction, _ in scored], [result for _, result in scored], primary_seconds)
+
+def resolve_transaction(transaction):
+    """Fill in graph features the client left out from the feature store"""
+    transaction_dict = transaction.dict()
+    missing = [feature for feature in GRAPH_FEATURES if transaction_dict[feature] is None]
+    if missing:
+        if transaction_dict['AccountId'] is None:
+            raise HTTPException(
+                status_code=422,
+                detail=f"AccountId is required when {missing} are not provided"
+            )
+        stored = feature_store.get_features(transaction_dict['AccountId'])
+        for feature in missing:
+            transaction_dict[feature] = stored[feature]
+    return transaction_dict
+
+def resolve_matrix(table):
+    """Feature matrix for an Arrow table, graph features missing filled from the feature store"""
+    X = wire_formats.table_to_matrix(table, FEATURE_NAMES)
+    missing = np.isnan(X)
+    for feature in ('TransactionAmount', 'AvailableBalance'):
+        if missing[:, FEATURE_NAMES.index(feature)].any():
+            raise HTTPException(status_code=422, detail=f"{feature} is required for every row")
+
+    graph_columns = [FEATURE_NAMES.index(feature) for feature in GRAPH_FEATURES]
+    rows = missing[:, graph_columns].any(axis=1).nonzero()[0]
+    if len(rows):
+        if 'AccountId' not in table.column_names:
+            raise HTTPException(
+                status_code=422,
+                detail=f"AccountId is required when {list(GRAPH_FEATURES)} are not provided"
+            )
+        account_ids = table.column('AccountId').take(rows).to_pylist()
+        if None in account_ids:
+            raise HTTPException(
+                status_code=422,
+                detail=f"AccountId is required when {list(GRAPH_FEATURES)} are not provided"
+            )
+        stored = feature_store.get_feature_matrix(account_ids)
+        block = X[np.ix_(rows, graph_columns)]
+        X[np.ix_(rows, graph_columns)] = np.where(np.isnan(block), stored, block)
+    return X
+
+def record_transfers(transfers):
+    """Apply settled transfers to the feature store, once per TransactionId"""
+    applied = feature_store.add_transfers(
+        (transfer.TransactionId, transfer.AccountId, transfer.ToAccountId, transfer.TransactionAmount)
+        for transfer in transfers
+    )
+    return {'recorded': applied, 'duplicates': len(transfers) - applied}
+
+result_cache = ResultCache(
+    FEATURE_NAMES,
+    max_entries=CACHE_SIZE,
+    ttl_s=CACHE_TTL_S,
+    bucket_widths=parse_bucket_widths(CACHE_BUCKETS)
+) if CACHE_SIZE > 0 else None
+
+DEGRADED = metrics.counter('duitguard_degraded_total', 'Responses scored below the requested tier')
+
+def request_deadline(request, started):
+    """time.monotonic() deadline of a request that arrived at started, None without a latency budget"""
+    budget_ms = request.headers.get('x-deadline-ms')
+    try:
+        budget_ms = float(budget_ms) if budget_ms is not None else DEADLINE_MS
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid X-Deadline-Ms header '{budget_ms}'")
+    return started + budget_ms / 1000 if budget_ms > 0 else None
+
+def account_risk_result(transaction_data):
+    """Fallback response once the deadline has passed, no model call"""
+    return {
+        'risk_score': feature_store.get_risk(transaction_data.get('AccountId')),
+        'scoring_tier': 'account_risk'
+    }
+
+def score_queued_transactions(items):
+    """Score queued (transaction, explain mode, deadline) items, one pass per explain mode
+
+    The response's scoring_tier is the explain mode that actually ran, or
+    'account_risk' when the deadline passed before scoring.
+    """
+    BATCH_SIZE.set(len(items))
+    start = time.perf_counter()
+
+    # Hold one pipeline for the whole batch so a hot reload can't split it
+    version, pipeline = registry.active()
+    results = [None] * len(items)
+    indices_by_mode = {}
+    now = time.monotonic()
+    shap_budget = SHAP_BUDGET_MS / 1000
+    # Until the background build finishes, 'full' would block the whole
+    # queue on the shap import, so those requests get native contributions
+    explainer_ready = pipeline.explainer_ready
+    for i, (transaction_data, mode, deadline) in enumerate(items):
+        if mode == 'full' and not explainer_ready:
+            mode = 'fast'
+        if deadline is not None:
+            if now >= deadline:
+                results[i] = account_risk_result(transaction_data)
+                continue
+            if mode == 'full' and deadline - now < shap_budget:
+                mode = 'none'
+        if result_cache is not None:
+            cached = result_cache.get(result_cache.key(version, mode, transaction_data))
+            if cached is not None:
+                # Cached results are shared, copy before tagging them
+                results[i] = {**pipeline.reinterpret(cached, transaction_data), 'scoring_tier': mode}
+                continue
+        indices_by_mode.setdefault(mode, []).append(i)
+
+    for mode, indices in indices_by_mode.items():
+        # SHAP is skipped per row, for the requests left with too little time
+        scored = pipeline.explain_batch(
+            [items[i][0] for i in indices],
+            mode=mode,
+            explain_by=[items[i][2] - shap_budget if items[i][2] is not None else None for i in indices]
+        )
+        for i, result in zip(indices, scored):
+            tier = mode if mode == 'none' or 'risk_factors' in result else 'none'
+            if result_cache is not None and tier == mode:
+                result_cache.put(result_cache.key(version, mode, items[i][0]), result)
+            results[i] = {**result, 'scoring_tier': tier}
+
+    for (_, mode, _), result in zip(items, results):
+        if result['scoring_tier'] != mode:
+            DEGRADED.inc()
+
+    transactions = [transaction for transaction, _, _ in items]
+    shadow_score(transactions, results, time.perf_counter() - start)
+    if not prefork_worker:
+        record_risk(pipeline, items, results)
+    return results
+
+def record_risk(pipeline, items, results):
+    """Blend the model's fraud probability into each sender's precomputed risk"""
+    feature_store.record_risk(
+        (transaction['AccountId'], sum(result['probabilities'][c] for c in pipeline.fraud_classes))
+        for (transaction, _, _), result in zip(items, results)
+        if transaction.get('AccountId') and 'probabilities' in result
+    )
+
+batcher = MicroBatcher(
+    score_queued_transactions,
+    window_ms=BATCH_WINDOW_MS,
+    max_batch_size=BATCH_MAX_SIZE
+)
+
+BATCH_SIZE = metrics.gauge('duitguard_batch_size', 'Size of the last scored micro-batch')
+QUEUE_DEPTH = metrics.gauge(
+    'duitguard_queue_depth',
+    'Requests waiting for the next micro-batch',
+    callback=lambda: batcher.queue_depth
+)
+
 # Initialize FastAPI
 app = FastAPI()
 
@@ -275,14 +836,237 @@ app.add_middleware(
 def read_root():
     return {"message": "Welcome to the fraud detection API"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    # Pre-fork workers report the totals of all workers, whichever takes the scrape
+    text = multiprocess_metrics.render() if multiprocess_metrics is not None else metrics.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+@app.get("/model")
+def read_model():
+    return {"version": registry.version}
+
+@app.get("/ready")
+def read_ready():
+    require_ready()
+    return {"ready": True, "version": registry.version}
+
+@app.on_event("startup")
+def start_serving():
+    if prefork_worker:
+        # Prepared by start_prefork_worker, reloads are driven by the parent
+        return
+    # Accept connections right away, /ready reports when loading is done
+    threading.Thread(target=start_up, name='startup', daemon=True).start()
+    registry.start_watching(RELOAD_INTERVAL_S)
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    await batcher.stop()
+    registry.stop_watching()
+    if shadow is not None:
+        shadow.shutdown()
+    if multiprocess_metrics is not None:
+        multiprocess_metrics.stop()
+
+def decode_body(body, content_type):
+    """Decode a JSON or MessagePack body, mapping failures to HTTP errors"""
+    try:
+        return wire_formats.decode_object(body, content_type)
+    except wire_formats.UnsupportedMediaType as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Malformed request body: {str(e)}")
+
+def validate_transaction(data):
+    try:
+        return Transaction(**data)
+    except (TypeError, ValidationError) as e:
+        errors = e.errors() if isinstance(e, ValidationError) else [{'msg': str(e)}]
+        raise RequestValidationError(errors)
+
+def encode_response(result, request, request_type):
+    """Respond in the format the client accepts, defaulting to the request's"""
+    response_type = wire_formats.negotiate(
+        request.headers.get('accept'), request_type, (wire_formats.JSON, wire_formats.MSGPACK)
+    )
+    if response_type == wire_formats.JSON:
+        return result
+    return Response(wire_formats.encode_object(result, response_type), media_type=response_type)
+
 @app.post("/predict")
-def predict(transaction: Transaction):
-    transaction_dict = transaction.dict()
-    result = pipeline.explain_prediction(transaction_dict)
-    return result
+async def predict(request: Request, explain: Optional[ExplainMode] = None):
+    """Score one transaction sent as JSON or MessagePack"""
+    # The latency budget counts from arrival, decoding and lookups included
+    deadline = request_deadline(request, time.monotonic())
+    require_ready()
+    content_type = wire_formats.media_type(request.headers.get('content-type'))
+    transaction = validate_transaction(decode_body(await request.body(), content_type))
+    transaction_dict = resolve_transaction(transaction)
+    try:
+        result = await asyncio.wait_for(
+            batcher.submit((transaction_dict, explain or EXPLAIN_MODE, deadline)),
+            timeout=deadline - time.monotonic() if deadline is not None else None
+        )
+    except asyncio.TimeoutError:
+        DEGRADED.inc()
+        result = account_risk_result(transaction_dict)
+    return encode_response(result, request, content_type)
+
+@app.post("/predict/batch")
+async def predict_batch(request: Request):
+    """Score a JSON or MessagePack list of transactions, or an Arrow IPC stream
+
+    Arrow tables go straight from columns to the feature matrix and are
+    answered with an Arrow stream of prediction, confidence and prob_<class>
+    columns, without creating a Python object per row.
+    """
+    require_ready()
+    content_type = wire_formats.media_type(request.headers.get('content-type'))
+    body = await request.body()
+    if content_type == wire_formats.ARROW_STREAM:
+        return await run_in_threadpool(predict_arrow_batch, body)
+
+    data = decode_body(body, content_type)
+    if not isinstance(data, list):
+        raise RequestValidationError([{'loc': ('body',), 'msg': 'Expected a list of transactions'}])
+    transactions = [validate_transaction(item) for item in data]
+    results = await run_in_threadpool(score_transactions, transactions)
+    return encode_response(results, request, content_type)
+
+@app.post("/transfers")
+async def report_transfers(request: Request):
+    """Record settled transfers, a JSON or MessagePack list, in the feature store
+
+    Scoring a transaction does not record it, since it may be declined or
+    retried. Transfers already recorded under the same TransactionId are
+    ignored, so reporting one again is safe. Refused with 409 in pre-fork
+    mode, where each worker holds its own copy of the feature store.
+    """
+    require_ready()
+    if prefork_worker:
+        raise HTTPException(
+            status_code=409,
+            detail="Transfers can't be recorded with pre-fork workers, each has its own feature store; "
+                   "run a single worker to record them"
+        )
+    content_type = wire_formats.media_type(request.headers.get('content-type'))
+    data = decode_body(await request.body(), content_type)
+    if not isinstance(data, list):
+        raise RequestValidationError([{'loc': ('body',), 'msg': 'Expected a list of transfers'}])
+    try:
+        transfers = [Transfer(**item) for item in data]
+    except (TypeError, ValidationError) as e:
+        errors = e.errors() if isinstance(e, ValidationError) else [{'msg': str(e)}]
+        raise RequestValidationError(errors)
+    return encode_response(record_transfers(transfers), request, content_type)
+
+def score_transactions(transactions):
+    transaction_dicts = [resolve_transaction(transaction) for transaction in transactions]
+    start = time.perf_counter()
+    results = registry.pipeline.predict_batch(transaction_dicts)
+    shadow_score(transaction_dicts, results, time.perf_counter() - start)
+    return results
+
+def predict_arrow_batch(body):
+    try:
+        table = wire_formats.read_arrow_table(body)
+    except wire_formats.UnsupportedMediaType as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Malformed Arrow stream: {str(e)}")
+
+    try:
+        X = resolve_matrix(table)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid feature column: {str(e)}")
+    pipeline = registry.pipeline
+    # The primary scales X in place, the shadow model needs the raw values
+    shadow_X = X.copy() if shadow is not None else None
+    start = time.perf_counter()
+    columns = pipeline.format_columns(pipeline.predict_proba_matrix(X))
+    if shadow is not None:
+        shadow.submit_matrix(shadow_X, columns, time.perf_counter() - start)
+    return Response(wire_formats.encode_arrow(columns), media_type=wire_formats.ARROW_STREAM)
+
+def start_prefork_worker(threads_per_worker):
+    """Prepare a freshly forked worker to serve the shared pipeline"""
+    global prefork_worker
+    prefork_worker = True
+    pipeline = registry.pipeline
+    pipeline.set_threads(threads_per_worker)
+    # Booster threads only start here, after the fork
+    pipeline.warm_up()
+    mark_ready()
+    multiprocess_metrics.start()
+
+# Bundle the pre-fork parent served before the last reload, restored if the
+# workers fail to warm up the new one
+previous_active = None
+
+def reload_before_restart():
+    """Load a new registry version in the pre-fork parent, True if one was activated"""
+    global previous_active
+    previous = registry.active()
+    if registry.refresh(warm_up=False) == previous[0]:
+        return False
+    try:
+        registry.pipeline.explainer
+    except Exception as e:
+        logging.error(f"Failed to build the explainer for model version {registry.version}: {str(e)}")
+        registry.mark_failed(registry.version)
+        registry.activate(*previous)
+        return False
+    previous_active = previous
+    return True
+
+def reload_failed():
+    """Go back to the previous bundle after workers failed to warm up the new one"""
+    registry.mark_failed(registry.version)
+    registry.activate(*previous_active)
+
+def serve(host, port, workers=1, threads_per_worker=None):
+    """Run the API, forking workers that share one loaded model bundle when workers > 1"""
+    global multiprocess_metrics
+    if workers <= 1:
+        uvicorn.run(app, host=host, port=port)
+        return
+
+    # Load once in the parent. Warm-up would start the booster's OpenMP
+    # threads, which don't survive fork, so each worker warms up itself.
+    # The explainer is built here regardless of LAZY_EXPLAINER so the
+    # workers share it instead of each importing shap.
+    load_serving_pipeline(warm_up_modes=())
+    registry.pipeline.explainer
+    load_feature_store()
+    logging.info("Feature store is read-only with pre-fork workers, /transfers is disabled")
+    load_shadow()
+    threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+
+    multiprocess_metrics = MultiprocessMetrics(
+        metrics, METRICS_DIR or tempfile.mkdtemp(prefix='duitguard-metrics-')
+    )
+    multiprocess_metrics.clear()
+
+    PreforkServer(
+        app, host, port, workers,
+        on_worker_start=lambda: start_prefork_worker(threads_per_worker),
+        reload_check=reload_before_restart,
+        reload_interval=RELOAD_INTERVAL_S,
+        reload_failed=reload_failed
+    ).run()
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    parser = argparse.ArgumentParser(description="DuitGuard fraud detection API")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('DUITGUARD_WORKERS', '1')),
+                        help="Pre-forked worker processes sharing one model bundle")
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help="Booster threads per worker, defaults to cores / workers")
+    args = parser.parse_args()
+
+    serve(args.host, args.port, workers=args.workers, threads_per_worker=args.threads_per_worker)
 def main():
     pipeline = load_fraud_detection_pipeline()
     
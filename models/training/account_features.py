@@ -0,0 +1,97 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_FEATURES = ('account_type', 'account_age_days', 'avg_balance', 'balance_std', 'pending_ratio')
+
+
+class AccountFeatureTable:
+    """Per-account profile and balance features as columnar arrays
+
+    Row i holds the features of account_ids[i]. When built for a
+    TransactionGraph's node_ids, rows line up with the graph's integer node
+    index, so one index serves graph metrics and account features alike.
+    has_account marks rows found in the accounts frame; the others are 0.
+
+    Balance aggregates follow the per-account pandas expressions they
+    replace: missing balances count as 0, balance_std is the sample standard
+    deviation (NaN for a single snapshot) and pending_ratio is pending over
+    available balance, the latter floored at 1.
+    """
+
+    def __init__(self, account_ids, columns, has_account):
+        self.account_ids = np.asarray(account_ids, dtype=object)
+        self.account_index = {account_id: i for i, account_id in enumerate(self.account_ids)}
+        self.columns = columns
+        self.has_account = has_account
+
+    @classmethod
+    def from_frames(cls, accounts_df, balances_df, account_ids=None, now=None):
+        """Build the table in one pass over each frame
+
+        account_ids fixes the row order (e.g. graph.node_ids), by default
+        every account in accounts_df in order of appearance.
+        """
+        now = pd.Timestamp.now() if now is None else now
+        accounts = accounts_df.drop_duplicates('AccountId').set_index('AccountId')
+        if account_ids is None:
+            account_ids = accounts.index.to_numpy()
+        account_ids = pd.Index(account_ids)
+
+        balances = balances_df[['AccountId']].assign(
+            available=balances_df['AvailableBalance'].fillna(0),
+            pending=balances_df['PendingBalance'].fillna(0)
+        )
+        balance_stats = balances.groupby('AccountId', sort=False).agg(
+            avg_balance=('available', 'mean'),
+            balance_std=('available', 'std'),
+            available_sum=('available', 'sum'),
+            pending_sum=('pending', 'sum')
+        ).reindex(account_ids)
+
+        profiles = accounts.reindex(account_ids)
+        has_account = account_ids.isin(accounts.index)
+        created = pd.to_datetime(profiles['CreatedDate'])
+        columns = {
+            'account_type': (profiles['AccountType'] == 'E-Wallet (Individual)').to_numpy(dtype=np.float64),
+            'account_age_days': (now - created).dt.days.to_numpy(dtype=np.float64, na_value=0.0),
+            'avg_balance': balance_stats['avg_balance'].to_numpy(dtype=np.float64),
+            'balance_std': balance_stats['balance_std'].to_numpy(dtype=np.float64),
+            'pending_ratio': (
+                balance_stats['pending_sum'].fillna(0)
+                / np.maximum(balance_stats['available_sum'].fillna(0), 1)
+            ).to_numpy(dtype=np.float64),
+        }
+        columns = {name: np.where(has_account, array, 0.0) for name, array in columns.items()}
+
+        logger.info(
+            f"Account feature table built for {len(account_ids)} accounts "
+            f"({int(has_account.sum())} with account records)"
+        )
+        return cls(account_ids.to_numpy(dtype=object), columns, has_account)
+
+    def __len__(self):
+        return len(self.account_ids)
+
+    def index_of(self, account_id):
+        """Row of an account, -1 if it is not in the table"""
+        return self.account_index.get(account_id, -1)
+
+    def features(self, account_id):
+        """Feature dict of one account, KeyError when there is no account record"""
+        index = self.index_of(account_id)
+        if index < 0 or not self.has_account[index]:
+            raise KeyError(f"{account_id} has no account record")
+        return {name: float(self.columns[name][index]) for name in ACCOUNT_FEATURES}
+
+    def lookup(self, indices):
+        """(len(indices), len(ACCOUNT_FEATURES)) matrix of the given rows, zeros for -1"""
+        indices = np.asarray(indices, dtype=np.int64)
+        known = indices >= 0
+        matrix = np.zeros((len(indices), len(ACCOUNT_FEATURES)))
+        for j, name in enumerate(ACCOUNT_FEATURES):
+            matrix[known, j] = self.columns[name][indices[known]]
+        return matrix
@@ -0,0 +1,119 @@
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Cosine distance reported when an account has no embedding or there is nothing to compare with
+UNKNOWN_DISTANCE = 2.0
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class EmbeddingIndex:
+    """Inverted file (IVF) index for cosine similarity search over embeddings
+
+    Vectors are normalized and clustered by spherical k-means into n_lists
+    lists around unit centroids. A query scores the centroids, then only the
+    vectors of the nprobe best lists, so it touches about
+    nprobe / n_lists of the vectors instead of all of them. ids[i] is what
+    row i stands for, e.g. a graph node index. Rows live in insertion order
+    and order/list_indptr hold the rows of each list (CSR style), so vectors
+    can be replaced and added without clustering again.
+    """
+
+    def __init__(self, centroids, vectors, ids, assignment, nprobe=8):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.row_of = {node: row for row, node in enumerate(self.ids.tolist())}
+        self.assignment = assignment
+        self.nprobe = min(nprobe, len(centroids))
+        self._index_lists()
+
+    @classmethod
+    def build(cls, embeddings, ids=None, n_lists=None, nprobe=8, n_iter=10, seed=0):
+        """Cluster the embeddings and fill the lists, n_lists defaults to about sqrt(n)"""
+        started = time.time()
+        vectors = _normalize(embeddings)
+        n_vectors = len(vectors)
+        ids = np.arange(n_vectors) if ids is None else ids
+        n_lists = max(1, min(n_lists or int(np.sqrt(n_vectors)), n_vectors))
+
+        rng = np.random.default_rng(seed)
+        # Train the quantizer on a sample of at most 256 vectors per list
+        sample = vectors[rng.choice(n_vectors, size=min(n_vectors, n_lists * 256), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+        for _ in range(n_iter):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, sample)
+            filled = np.bincount(nearest, minlength=n_lists) > 0
+            centroids[filled] = _normalize(sums[filled])
+
+        index = cls(centroids, vectors, ids, np.argmax(vectors @ centroids.T, axis=1), nprobe)
+        logger.info(
+            f"Embedding index built over {n_vectors} vectors in {n_lists} lists "
+            f"in {time.time() - started:.2f} seconds"
+        )
+        return index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _index_lists(self):
+        self.order = np.argsort(self.assignment, kind='stable')
+        self.list_indptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(self.assignment, minlength=len(self.centroids)))]
+        )
+
+    def contains(self, node):
+        return node in self.row_of
+
+    def search(self, vector, k=10, exclude=None):
+        """ids and cosine similarities of the k nearest vectors, best first, skipping id exclude"""
+        query = _normalize(vector)
+        if not query.any() or not len(self.ids):
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, self.nprobe - 1)[:self.nprobe]
+        rows = np.concatenate([self.order[self.list_indptr[i]:self.list_indptr[i + 1]] for i in probe])
+        if exclude is not None:
+            rows = rows[self.ids[rows] != exclude]
+        scores = self.vectors[rows] @ query
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        best = np.argsort(-scores, kind='stable')
+        return self.ids[rows[best]], scores[best]
+
+    def nearest_distance(self, vector, exclude=None):
+        """Cosine distance to the nearest vector, UNKNOWN_DISTANCE when there is none"""
+        _, scores = self.search(vector, k=1, exclude=exclude)
+        return float(1.0 - scores[0]) if len(scores) else UNKNOWN_DISTANCE
+
+    def update(self, ids, embeddings):
+        """Replace the vectors of known ids and add the others, reassigning their lists"""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = _normalize(embeddings)
+        lists = np.argmax(vectors @ self.centroids.T, axis=1)
+
+        rows = np.fromiter((self.row_of.get(node, -1) for node in ids.tolist()), dtype=np.int64, count=len(ids))
+        known = rows >= 0
+        self.vectors[rows[known]] = vectors[known]
+        self.assignment[rows[known]] = lists[known]
+
+        added = ~known
+        if added.any():
+            start = len(self.ids)
+            self.vectors = np.concatenate([self.vectors, vectors[added]])
+            self.ids = np.concatenate([self.ids, ids[added]])
+            self.assignment = np.concatenate([self.assignment, lists[added]])
+            self.row_of.update(zip(ids[added].tolist(), range(start, len(self.ids))))
+        self._index_lists()
@@ -1,7 +1,5 @@
 import pandas as pd
 import numpy as np
-import networkx as nx
-import node2vec
 from gensim.models import Word2Vec
 import xgboost as xgb
 from sklearn.model_selection import train_test_split
@@ -11,43 +9,111 @@ import ast
 import logging
 import json
 import os
+from transaction_graph import TransactionGraph, fraud_labels
+from centrality import CentralityEngine
+from account_features import ACCOUNT_FEATURES, AccountFeatureTable
+from random_walks import RandomWalker
+from embedding_index import UNKNOWN_DISTANCE, EmbeddingIndex
+from temporal_graph import TemporalGraph
 
 class GraphModel:
-    def __init__(self, embedding_dim=16):
+    def __init__(self, embedding_dim=16, pagerank_weight=None, betweenness='exact',
+                 betweenness_k=None, betweenness_epsilon=None, full_recompute_every=24, embedding_hops=2):
         # Initialize basic attributes
         self.embedding_dim = embedding_dim
+        # Edge weighting for PageRank: None, 'amount' or 'count'
+        self.pagerank_weight = pagerank_weight
+        # Betweenness mode ('exact', 'approx' or 'disabled'), approx samples
+        # betweenness_k pivots or enough for betweenness_epsilon max error
+        self.betweenness = betweenness
+        self.betweenness_k = betweenness_k
+        self.betweenness_epsilon = betweenness_epsilon
+        # add_transactions() batches between full metric recomputations
+        self.full_recompute_every = full_recompute_every
+        self.batches_since_recompute = 0
+        # Hops around new accounts re-walked by update_embeddings()
+        self.embedding_hops = embedding_hops
         self.graph = None
+        self.centrality = None
+        self.temporal = None  # Windowed transfer velocity, when transactions have a BookingDateTime
+        self.cached_metrics = {}
         self.model = None
         self.node_embeddings = None
+        self.embeddings = None  # (n_nodes, embedding_dim) matrix in graph index order
+        self.walker = None
+        self.word2vec = None
+        self.embedding_index = None
+        self.fraud_index = None  # Over the embeddings of accounts labelled as fraud
+        self.account_features = None
         self.account_map = {}
         self.feature_matrix = None  # Store feature matrix for later use
 
 
     def build_graph(self, transactions_df):
             """Build directed graph from transaction data with cached metrics"""
-            self.graph = nx.DiGraph()
-            
-            # Add edges from transactions
-            for _, row in transactions_df.iterrows():
-                self.graph.add_edge(row['AccountId'], row['ToAccountId'])
-            
-            # Pre-compute and cache network metrics for better performance
-            logging.info("Pre-computing network metrics...")
-            self.cached_metrics = {
-                'pagerank': nx.pagerank(self.graph),
-                'betweenness': nx.betweenness_centrality(self.graph),
-            }
-            logging.info("Network metrics computed successfully")
+            # Integer-encoded CSR/CSC arrays, parallel transfers aggregated per edge
+            self.graph = TransactionGraph.from_transactions(transactions_df)
+            self.centrality = CentralityEngine(self.graph)
+            self.account_features = None
+            if 'BookingDateTime' in transactions_df.columns:
+                self.temporal = TemporalGraph.from_transactions(transactions_df)
+            self.compute_metrics()
+
+    def compute_metrics(self):
+        """Pre-compute and cache network metrics for better performance"""
+        logging.info("Pre-computing network metrics...")
+        # Arrays indexed like the graph's nodes
+        betweenness, betweenness_error = self.centrality.betweenness(
+            self.betweenness, k=self.betweenness_k, epsilon=self.betweenness_epsilon
+        )
+        self.cached_metrics = {
+            'pagerank': self.centrality.pagerank(weight=self.pagerank_weight),
+            'betweenness': betweenness,
+            'betweenness_error': betweenness_error,
+        }
+        self.batches_since_recompute = 0
+        logging.info("Network metrics computed successfully")
+
+    def add_transactions(self, batch):
+        """Apply a batch of new transfers so network features reflect it right away
+
+        Degrees and weights are updated in place and PageRank is refreshed
+        from the previous vector. Betweenness of new accounts stays 0 until
+        the full recomputation every full_recompute_every batches. New
+        accounts are embedded right away once embeddings were generated.
+        """
+        new_nodes = self.graph.add_transactions(batch)
+        if self.temporal is not None and 'BookingDateTime' in batch.columns:
+            self.temporal.add_transactions(batch)
+        self.batches_since_recompute += 1
+        if self.batches_since_recompute >= self.full_recompute_every:
+            self.compute_metrics()
+        else:
+            self.cached_metrics['pagerank'] = self.centrality.pagerank(
+                weight=self.pagerank_weight, start=self.cached_metrics['pagerank']
+            )
+            betweenness = self.cached_metrics['betweenness']
+            self.cached_metrics['betweenness'] = np.concatenate(
+                [betweenness, np.zeros(self.graph.n_nodes - len(betweenness))]
+            )
+
+        if self.word2vec is not None and len(new_nodes):
+            self.update_embeddings(new_nodes)
+        return new_nodes
 
     def get_network_features(self, account_id):
         """Extract network features with proper error handling"""
         try:
+            index = self.graph.index_of(account_id)
+            if index < 0:
+                raise KeyError(f"{account_id} is not in the graph")
+
             network_features = {
-                'in_degree': float(self.graph.in_degree(account_id) or 0),
-                'out_degree': float(self.graph.out_degree(account_id) or 0),
-                'total_degree': float(self.graph.degree(account_id) or 0),
-                'pagerank': float(self.cached_metrics['pagerank'].get(account_id, 0)),
-                'betweenness': float(self.cached_metrics['betweenness'].get(account_id, 0))
+                'in_degree': float(self.graph.in_degree[index]),
+                'out_degree': float(self.graph.out_degree[index]),
+                'total_degree': float(self.graph.in_degree[index] + self.graph.out_degree[index]),
+                'pagerank': float(self.cached_metrics['pagerank'][index]),
+                'betweenness': float(self.cached_metrics['betweenness'][index])
             }
             
             # Ensure all values are scalar floats
@@ -71,61 +137,165 @@ class GraphModel:
     def generate_embeddings(self):
         """Generate node2vec embeddings for graph nodes"""
         try:
-            # Convert node IDs to strings for node2vec
-            for n in self.graph.nodes():
-                self.graph.nodes[n]['id'] = str(n)
-            
-            # Initialize node2vec with reasonable parameters
-            node2vec_model = node2vec.Node2Vec(
+            # Biased walks over the CSR arrays, one process per core
+            walker = RandomWalker(
                 self.graph,
                 dimensions=self.embedding_dim,
                 walk_length=5,
-                num_walks=3,  # Reduced for MVP
-                workers=4,
+                num_walks=3,
                 p=1,
                 q=1
             )
-            
-            model = node2vec_model.fit(window=3, min_count=1, epochs=1)
-            
-            # Safely store embeddings
-            self.node_embeddings = {}
-            for node in self.graph.nodes():
-                try:
-                    self.node_embeddings[node] = model.wv[str(node)]
-                except KeyError:
-                    logging.warning(f"No embedding found for node {node}")
-                    self.node_embeddings[node] = np.zeros(self.embedding_dim)
-                    
+
+            model = walker.fit(window=3, min_count=1, epochs=1)
+
+            # Keep the walker settings and model for update_embeddings()
+            self.walker = walker
+            self.word2vec = model
+            self.embeddings = self._embedding_matrix()
+            self.node_embeddings = dict(zip(self.graph.node_ids, self.embeddings))
+            self.embedding_index = None
+            self.fraud_index = None
+
         except Exception as e:
             logging.error(f"Error generating embeddings: {str(e)}")
             self.node_embeddings = None
 
+    def update_embeddings(self, new_nodes, hops=None):
+        """Embed new accounts by continuing Word2Vec training on walks around them
+
+        Walks start only from new_nodes and accounts within hops transfers of
+        them. Rows whose vectors moved are updated in node_embeddings and the
+        embedding matrix, returns their node indices.
+        """
+        try:
+            hops = self.embedding_hops if hops is None else hops
+            region = self.graph.neighbourhood(new_nodes, hops)
+            # A fresh seed per graph version, so the new walks are not replays
+            walker = self.walker.for_graph(self.graph, seed=self.graph.version)
+            corpus = walker.corpus(start_nodes=region)
+            self.word2vec.build_vocab(corpus, update=True)
+            self.word2vec.train(corpus, total_examples=self.word2vec.corpus_count, epochs=self.word2vec.epochs)
+
+            embeddings = self._embedding_matrix()
+            n_known = len(self.embeddings)
+            changed = np.concatenate([
+                np.flatnonzero((embeddings[:n_known] != self.embeddings).any(axis=1)),
+                np.arange(n_known, len(embeddings))
+            ])
+            self.embeddings = embeddings
+            for i in changed:
+                self.node_embeddings[self.graph.node_ids[i]] = embeddings[i]
+            if self.embedding_index is not None:
+                self.embedding_index.update(changed, embeddings[changed])
+            if self.fraud_index is not None:
+                fraud_changed = changed[np.fromiter(
+                    (self.fraud_index.contains(i) for i in changed.tolist()), dtype=bool, count=len(changed)
+                )]
+                self.fraud_index.update(fraud_changed, embeddings[fraud_changed])
+            logging.info(
+                f"Embedded {len(new_nodes)} new accounts from {len(region)} walk starts, "
+                f"{len(changed)} vectors updated"
+            )
+            return changed
+
+        except Exception as e:
+            logging.error(f"Error updating embeddings: {str(e)}")
+            return np.array([], dtype=np.int64)
+
+    def _embedding_matrix(self):
+        """Word2Vec vectors in graph index order, zeros for accounts without one"""
+        embeddings = np.zeros((self.graph.n_nodes, self.embedding_dim), dtype=np.float32)
+        rows = np.fromiter(
+            (self.word2vec.wv.key_to_index.get(str(node), -1) for node in self.graph.node_ids),
+            dtype=np.int64,
+            count=self.graph.n_nodes
+        )
+        found = rows >= 0
+        embeddings[found] = self.word2vec.wv.vectors[rows[found]]
+        if not found.all():
+            logging.warning(f"No embedding found for {int((~found).sum())} nodes")
+        return embeddings
+
+    def save_embeddings(self, path):
+        """Persist the embedding matrix keyed by account index and the Word2Vec model"""
+        np.savez(
+            path,
+            account_ids=self.graph.node_ids.astype(str),
+            embeddings=self.embeddings,
+            walker_settings=json.dumps(self.walker.settings())
+        )
+        self.word2vec.save(f"{os.path.splitext(path)[0]}_word2vec.model")
+
+    def load_embeddings(self, path):
+        """Restore embeddings saved by save_embeddings() onto the current graph's index"""
+        with np.load(path) as saved:
+            account_ids, saved_embeddings = saved['account_ids'], saved['embeddings']
+            walker_settings = json.loads(str(saved['walker_settings']))
+        self.walker = RandomWalker(self.graph, **walker_settings)
+        self.word2vec = Word2Vec.load(f"{os.path.splitext(path)[0]}_word2vec.model")
+        self.embeddings = np.zeros((self.graph.n_nodes, self.embedding_dim), dtype=np.float32)
+        rows = np.fromiter((self.graph.index_of(a) for a in account_ids), dtype=np.int64, count=len(account_ids))
+        self.embeddings[rows[rows >= 0]] = saved_embeddings[rows >= 0]
+        self.node_embeddings = dict(zip(self.graph.node_ids, self.embeddings))
+        self.embedding_index = None
+        self.fraud_index = None
+
+    def build_embedding_index(self, labels=None):
+        """ANN indexes over the embeddings of all accounts and, given labels, of the fraud accounts"""
+        if self.embeddings is None:
+            logging.warning("No embeddings to index")
+            return
+        self.embedding_index = EmbeddingIndex.build(self.embeddings)
+        if labels is not None:
+            fraud_nodes = np.flatnonzero(np.asarray(labels) == 1)
+            self.fraud_index = EmbeddingIndex.build(self.embeddings[fraud_nodes], ids=fraud_nodes) \
+                if len(fraud_nodes) else None
+
+    def similar_accounts(self, account_id, k=10):
+        """(AccountId, cosine similarity) of the k accounts with the closest embeddings"""
+        index = self.graph.index_of(account_id)
+        if self.embedding_index is None or index < 0:
+            return []
+        nodes, scores = self.embedding_index.search(self.embeddings[index], k=k, exclude=index)
+        return list(zip(self.graph.node_ids[nodes], scores.tolist()))
+
+    def fraud_distance(self, account_id):
+        """Cosine distance from an account's embedding to the nearest other fraud account's"""
+        index = self.graph.index_of(account_id)
+        if self.fraud_index is None or index < 0:
+            return UNKNOWN_DISTANCE
+        return self.fraud_index.nearest_distance(self.embeddings[index], exclude=index)
+
+
+    def get_account_features(self, accounts_df, balances_df):
+        """Account and balance feature table, built once for the graph's accounts
+
+        Rows 0..n_nodes - 1 follow the graph's node index, accounts outside
+        the graph come after them.
+        """
+        if self.account_features is None:
+            node_ids = self.graph.node_ids if self.graph is not None else np.array([], dtype=object)
+            other_ids = accounts_df['AccountId'][~accounts_df['AccountId'].isin(node_ids)].unique()
+            self.account_features = AccountFeatureTable.from_frames(
+                accounts_df, balances_df, account_ids=np.concatenate([node_ids, other_ids])
+            )
+        return self.account_features
 
     def get_node_features(self, account_id, accounts_df, balances_df):
         """Extract account, balance and network features"""
         try:
-            # Account features
-            account_info = accounts_df[accounts_df['AccountId'] == account_id].iloc[0]
-            account_features = {
-                'account_type': float(account_info.get('AccountType') == 'E-Wallet (Individual)'),
-                'account_age_days': float((pd.Timestamp.now() - pd.to_datetime(account_info['CreatedDate'])).days)
-            }
-
-            # Balance features 
-            balances = balances_df[balances_df['AccountId'] == account_id]
-            balance_features = {
-                'avg_balance': float(balances['AvailableBalance'].fillna(0).mean()),
-                'balance_std': float(balances['AvailableBalance'].fillna(0).std()),
-                'pending_ratio': float(balances['PendingBalance'].fillna(0).sum() / 
-                                    max(balances['AvailableBalance'].fillna(0).sum(), 1))
-            }
+            # Account and balance features
+            account_features = self.get_account_features(accounts_df, balances_df).features(account_id)
 
             # Network features
             network_features = self.get_network_features(account_id)
 
+            # Transfer velocity over the last 1h, 24h and 7d
+            temporal_features = self.temporal.features(account_id) if self.temporal is not None else {}
+
             # Combine all features
-            features = {**account_features, **balance_features, **network_features}
+            features = {**account_features, **network_features, **temporal_features}
 
             # Add embeddings if available
             if self.node_embeddings and account_id in self.node_embeddings:
@@ -135,6 +305,7 @@ class GraphModel:
             else:
                 for i in range(self.embedding_dim):
                     features[f'embedding_{i}'] = 0.0
+            features['fraud_distance'] = self.fraud_distance(account_id)
 
             return features
 
@@ -153,11 +324,52 @@ class GraphModel:
                 'pagerank': 0.0,
                 'betweenness': 0.0
             }
+            if self.temporal is not None:
+                default_features.update(dict.fromkeys(self.temporal.feature_names(), 0.0))
             # Add zero embeddings
             for i in range(self.embedding_dim):
                 default_features[f'embedding_{i}'] = 0.0
+            default_features['fraud_distance'] = UNKNOWN_DISTANCE
             return default_features
         
+    def get_feature_matrix(self, account_ids, accounts_df, balances_df):
+        """Features of many accounts at once, same columns and defaults as get_node_features"""
+        table = self.get_account_features(accounts_df, balances_df)
+        rows = np.fromiter((table.index_of(a) for a in account_ids), dtype=np.int64, count=len(account_ids))
+        nodes = np.fromiter((self.graph.index_of(a) for a in account_ids), dtype=np.int64, count=len(account_ids))
+        in_graph = nodes >= 0
+
+        columns = dict(zip(ACCOUNT_FEATURES, table.lookup(rows).T))
+        for name, values in (
+            ('in_degree', self.graph.in_degree),
+            ('out_degree', self.graph.out_degree),
+            ('total_degree', self.graph.in_degree + self.graph.out_degree),
+            ('pagerank', self.cached_metrics['pagerank']),
+            ('betweenness', self.cached_metrics['betweenness'])
+        ):
+            columns[name] = np.zeros(len(nodes))
+            columns[name][in_graph] = values[nodes[in_graph]]
+        if self.temporal is not None:
+            temporal = self.temporal.feature_matrix(account_ids)
+            columns.update({name: values.to_numpy() for name, values in temporal.items()})
+
+        embeddings = np.zeros((len(nodes), self.embedding_dim))
+        if self.node_embeddings:
+            for i, account_id in enumerate(account_ids):
+                if account_id in self.node_embeddings:
+                    embeddings[i] = self.node_embeddings[account_id]
+        for i in range(self.embedding_dim):
+            columns[f'embedding_{i}'] = embeddings[:, i]
+        columns['fraud_distance'] = np.array([self.fraud_distance(a) for a in account_ids])
+
+        features = pd.DataFrame(columns)
+        # Like get_node_features, accounts without a record get all-zero features
+        has_account = np.zeros(len(rows), dtype=bool)
+        has_account[rows >= 0] = table.has_account[rows[rows >= 0]]
+        features.loc[~has_account] = 0.0
+        features.loc[~has_account, 'fraud_distance'] = UNKNOWN_DISTANCE
+        return features
+
     def train_model(self, features, labels, validation_df=None):
         try:
             # Undersample the majority class
@@ -271,6 +483,10 @@ class GraphModel:
             
             with open(f"models/{filename}_features.json", 'w') as f:
                 json.dump(feature_info, f)
+
+            # Save embeddings for incremental updates
+            if self.word2vec is not None:
+                self.save_embeddings(f"models/{filename}_embeddings.npz")
                 
             logging.info(f"Model saved to {model_path}")
             return True
@@ -317,12 +533,17 @@ if __name__ == "__main__":
         logging.info("Generating embeddings...")
         model.generate_embeddings()
 
+        logging.info("Labelling accounts...")
+        # Accounts that sent or received a fraudulent transfer, aligned with the graph's nodes
+        labels = fraud_labels(transactions_df, model.graph.node_ids)
+
+        logging.info("Indexing embeddings...")
+        model.build_embedding_index(labels)
+
         logging.info("Extracting features...")
-        features = []
-        labels = []
-        
+        features = model.get_feature_matrix(model.graph.node_ids, accounts_df, balances_df)
 
-        if not features:
+        if features.empty:
             logging.error("No valid features extracted")
             exit(1)
 
@@ -0,0 +1,212 @@
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from transaction_graph import _edge_keys
+
+logger = logging.getLogger(__name__)
+
+# Walk tables shared with the pool workers, which are forked after it is set
+_walk_tables = None
+
+
+def alias_tables(indptr, weights=None):
+    """Per-edge alias probabilities and offsets for sampling each node's out-edges
+
+    Row i of the CSR adjacency owns positions indptr[i]:indptr[i + 1]. Drawing
+    a slot k uniformly and keeping it with probability prob[k], else taking
+    alias[k], picks out-edges in proportion to weights (uniformly without).
+    Offsets are relative to indptr[i].
+    """
+    n_edges = int(indptr[-1])
+    degree = np.diff(indptr)
+    prob = np.ones(n_edges)
+    alias = (np.arange(n_edges) - np.repeat(indptr[:-1], degree)).astype(np.int32)
+    if weights is None:
+        return prob, alias
+
+    weights = np.asarray(weights, dtype=np.float64)
+    for node in np.flatnonzero(degree > 1):
+        start, end = indptr[node], indptr[node + 1]
+        row = weights[start:end]
+        if row.min() == row.max():
+            continue
+        # Vose's method on the row scaled to mean 1
+        scaled = row * (len(row) / row.sum())
+        small = [k for k in range(len(row)) if scaled[k] < 1.0]
+        large = [k for k in range(len(row)) if scaled[k] >= 1.0]
+        row_prob = prob[start:end]
+        row_alias = alias[start:end]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            row_prob[less] = scaled[less]
+            row_alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+    return prob, alias
+
+
+def _shard_walks(task):
+    """Walks from each start node of one shard, (n_starts, walk_length) padded with -1"""
+    starts, seed, shard = task
+    indptr, dst, keys, prob, alias, walk_length, p, q = _walk_tables
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(shard,)))
+    degree = np.diff(indptr)
+    biased = p != 1 or q != 1
+    max_bias = max(1.0 / p, 1.0, 1.0 / q)
+
+    walks = np.full((len(starts), walk_length), -1, dtype=np.int32)
+    walks[:, 0] = starts
+    for step in range(1, walk_length):
+        previous = walks[:, step - 1]
+        pending = np.flatnonzero(previous >= 0)
+        pending = pending[degree[previous[pending]] > 0]
+        # Second order steps draw from the first order alias tables and
+        # reject towards the p/q bias relative to the node walked from
+        while len(pending):
+            current = walks[pending, step - 1]
+            slot = (rng.random(len(pending)) * degree[current]).astype(np.int64)
+            keep = rng.random(len(pending)) < prob[indptr[current] + slot]
+            slot = np.where(keep, slot, alias[indptr[current] + slot])
+            candidate = dst[indptr[current] + slot]
+            if step == 1 or not biased:
+                walks[pending, step] = candidate
+                break
+
+            origin = walks[pending, step - 2]
+            edge_keys = _edge_keys(origin, candidate)
+            position = np.minimum(np.searchsorted(keys, edge_keys), len(keys) - 1)
+            bias = np.where(
+                candidate == origin, 1.0 / p, np.where(keys[position] == edge_keys, 1.0, 1.0 / q)
+            )
+            accepted = rng.random(len(pending)) * max_bias < bias
+            walks[pending[accepted], step] = candidate[accepted]
+            pending = pending[~accepted]
+    return walks
+
+
+class RandomWalker:
+    """node2vec random walks over a TransactionGraph's CSR arrays
+
+    Out-edges are drawn from per-edge alias tables (uniform, or in
+    proportion to an edge array such as 'amount'), and the return (p) and
+    in-out (q) bias is applied by rejection sampling, so nothing is stored
+    per pair of edges. Each round starts one walk from every node in a
+    shuffled order. Walks are generated in shards of walks_per_shard start
+    nodes on a process pool; shard i always uses the seed (seed, i), so the
+    walks do not depend on the number of workers.
+
+    fit() trains gensim Word2Vec on a corpus that regenerates the walks for
+    every pass instead of holding them in memory.
+    """
+
+    def __init__(self, graph, dimensions=16, walk_length=10, num_walks=5, p=1, q=1,
+                 weight=None, workers=None, seed=0, walks_per_shard=1024):
+        self.graph = graph
+        self.dimensions = dimensions
+        self.walk_length = walk_length
+        self.num_walks = num_walks
+        self.p = p
+        self.q = q
+        self.weight = weight
+        self.workers = workers or os.cpu_count() or 1
+        self.seed = seed
+        self.walks_per_shard = walks_per_shard
+        self.tokens = [str(account_id) for account_id in graph.node_ids]
+
+        started = time.time()
+        self.alias_prob, self.alias_index = alias_tables(
+            graph.indptr, None if weight is None else getattr(graph, weight)
+        )
+        logger.info(f"Alias tables for {graph.n_edges} edges built in {time.time() - started:.2f} seconds")
+
+    def settings(self):
+        """Constructor arguments other than the graph"""
+        return {
+            'dimensions': self.dimensions, 'walk_length': self.walk_length, 'num_walks': self.num_walks,
+            'p': self.p, 'q': self.q, 'weight': self.weight, 'workers': self.workers, 'seed': self.seed,
+            'walks_per_shard': self.walks_per_shard
+        }
+
+    def for_graph(self, graph, seed=None):
+        """Walker with the same settings over another (e.g. grown) graph"""
+        settings = self.settings()
+        if seed is not None:
+            settings['seed'] = seed
+        return RandomWalker(graph, **settings)
+
+    def shards(self, start_nodes=None):
+        """(start nodes, seed, shard number) of every shard, num_walks rounds over start_nodes"""
+        start_nodes = np.arange(self.graph.n_nodes) if start_nodes is None else np.asarray(start_nodes)
+        tasks = []
+        for round_number in range(self.num_walks):
+            rng = np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(round_number, 0)))
+            order = rng.permutation(start_nodes)
+            for start in range(0, len(order), self.walks_per_shard):
+                tasks.append((order[start:start + self.walks_per_shard], self.seed, len(tasks)))
+        return tasks
+
+    def iter_walks(self, start_nodes=None):
+        """Walk matrices shard by shard, with at most two shards per worker in flight"""
+        global _walk_tables
+        _walk_tables = (
+            self.graph.indptr, self.graph.dst, self.graph._keys, self.alias_prob, self.alias_index,
+            self.walk_length, self.p, self.q
+        )
+        tasks = self.shards(start_nodes)
+        if self.workers <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                yield _shard_walks(task)
+            return
+
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+            in_flight = deque()
+            for task in tasks:
+                in_flight.append(executor.submit(_shard_walks, task))
+                if len(in_flight) >= self.workers * 2:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+
+    def corpus(self, start_nodes=None):
+        return WalkCorpus(self, start_nodes)
+
+    def fit(self, window=10, min_count=1, start_nodes=None, **skip_gram_params):
+        """Train a skip-gram Word2Vec on the walks, keyed by str(AccountId)"""
+        from gensim.models import Word2Vec
+
+        skip_gram_params.setdefault('sg', 1)
+        skip_gram_params.setdefault('workers', self.workers)
+        skip_gram_params.setdefault('seed', self.seed)
+        started = time.time()
+        model = Word2Vec(
+            sentences=self.corpus(start_nodes),
+            vector_size=self.dimensions,
+            window=window,
+            min_count=min_count,
+            **skip_gram_params
+        )
+        logger.info(
+            f"Word2Vec trained on {self.num_walks} walks per node in {time.time() - started:.2f} seconds"
+        )
+        return model
+
+
+class WalkCorpus:
+    """Restartable iterable of walks as token lists, regenerated on every pass"""
+
+    def __init__(self, walker, start_nodes=None):
+        self.walker = walker
+        self.start_nodes = start_nodes
+
+    def __iter__(self):
+        tokens = self.walker.tokens
+        for walks in self.walker.iter_walks(self.start_nodes):
+            for walk in walks:
+                yield [tokens[node] for node in walk[walk >= 0]]
@@ -1,7 +1,5 @@
-import networkx as nx
 import logging
 import pandas as pd
-import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 import xgboost as xgb
@@ -9,6 +7,8 @@ from sklearn.metrics import classification_report, confusion_matrix
 from datetime import datetime
 import time
 from xgboost.callback import EarlyStopping
+from transaction_graph import TransactionGraph
+from centrality import CentralityEngine
 
 # Configure logging
 logging.basicConfig(
@@ -51,55 +51,21 @@ def create_graph_features(transactions):
     start_time = time.time()
     
     try:
-        G = nx.DiGraph()
-        total_rows = len(transactions)
+        # CSR graph with parallel transfers summed into amount-weighted edges
+        graph = TransactionGraph.from_transactions(transactions)
+        logger.info(f"Graph created with {graph.n_nodes} nodes and {graph.n_edges} edges")
         
-        # Batch process transactions
-        batch_size = 1000
-        for i in range(0, total_rows, batch_size):
-            batch = transactions.iloc[i:i+batch_size]
-            
-            for _, row in batch.iterrows():
-                try:
-                    from_account = row['AccountId']
-                    to_account = eval(row['CreditorAccount'])['AccountId']
-                    amount = row['TransactionAmount']
-                    
-                    if G.has_edge(from_account, to_account):
-                        G[from_account][to_account]['weight'] += amount
-                    else:
-                        G.add_edge(from_account, to_account, weight=amount)
-                except Exception as e:
-                    logger.warning(f"Error processing transaction: {str(e)}")
-                    continue
-            
-            logger.info(f"Processed {min(i+batch_size, total_rows)}/{total_rows} transactions")
-
-        logger.info(f"Graph created with {G.number_of_nodes()} nodes and {G.number_of_edges()} edges")
-        
-        # Calculate features in batches
-        features = {}
-        nodes = list(G.nodes())
-        pagerank = nx.pagerank(G)
-        betweenness = nx.betweenness_centrality(G)
+        centrality = CentralityEngine(graph)
+        pagerank = centrality.pagerank(weight='amount')
+        betweenness, _ = centrality.betweenness('exact')
         
-        for i, node in enumerate(nodes):
-            try:
-                features[node] = {
-                    'in_degree': G.in_degree(node),
-                    'out_degree': G.out_degree(node),
-                    'pagerank': pagerank.get(node, 0),
-                    'betweenness': betweenness.get(node, 0)
-                }
-                
-                if (i + 1) % 100 == 0:
-                    logger.info(f"Processed features for {i+1}/{len(nodes)} nodes")
-                    
-            except Exception as e:
-                logger.error(f"Error calculating features for node {node}: {str(e)}")
-                continue
+        df = pd.DataFrame({
+            'in_degree': graph.in_degree,
+            'out_degree': graph.out_degree,
+            'pagerank': pagerank,
+            'betweenness': betweenness
+        }, index=graph.node_ids)
         
-        df = pd.DataFrame.from_dict(features, orient='index')
         logger.info(f"Created graph features dataframe with shape {df.shape}")
         logger.info(f"Graph feature calculation completed in {time.time() - start_time:.2f} seconds")
         return df
@@ -0,0 +1,223 @@
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+from transaction_graph import _edge_keys, parse_creditor_account_ids
+
+logger = logging.getLogger(__name__)
+
+# Window name and length in seconds
+WINDOWS = {'1h': 3600, '24h': 86400, '7d': 604800}
+
+WINDOW_FEATURES = ('in_degree', 'out_degree', 'in_amount', 'out_amount', 'in_counterparties', 'out_counterparties')
+
+
+class _Window:
+    """Running per-account aggregates over the buckets inside one window"""
+
+    def __init__(self, span, capacity):
+        self.span = span
+        self.arrays = {
+            name: np.zeros(capacity, dtype=np.float64 if name.endswith('amount') else np.int64)
+            for name in WINDOW_FEATURES
+        }
+        # Sorted (sender, receiver) keys with their transfer count in the window
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def grow(self, capacity):
+        for name, array in self.arrays.items():
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:len(array)] = array
+            self.arrays[name] = grown
+
+    def apply(self, bucket, sign):
+        """Add (sign 1) or remove (sign -1) one bucket's per-pair aggregates"""
+        src, dst, count, amount = bucket
+        np.add.at(self.arrays['out_degree'], src, sign * count)
+        np.add.at(self.arrays['in_degree'], dst, sign * count)
+        np.add.at(self.arrays['out_amount'], src, sign * amount)
+        np.add.at(self.arrays['in_amount'], dst, sign * amount)
+
+        keys = _edge_keys(src, dst)
+        positions = np.searchsorted(self.keys, keys)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == keys[found]
+        if sign > 0:
+            self.counts[positions[found]] += count[found]
+            added = ~found
+            order = np.argsort(keys[added], kind='stable')
+            self.keys = np.insert(self.keys, positions[added][order], keys[added][order])
+            self.counts = np.insert(self.counts, positions[added][order], count[added][order])
+            np.add.at(self.arrays['out_counterparties'], src[added], 1)
+            np.add.at(self.arrays['in_counterparties'], dst[added], 1)
+        else:
+            # Every pair of a bucket leaving the window was added with it
+            self.counts[positions] -= count
+            emptied = self.counts[positions] == 0
+            np.add.at(self.arrays['out_counterparties'], src[emptied], -1)
+            np.add.at(self.arrays['in_counterparties'], dst[emptied], -1)
+            kept = self.counts > 0
+            self.keys, self.counts = self.keys[kept], self.counts[kept]
+
+
+class TemporalGraph:
+    """Per-account transfer velocity over sliding time windows
+
+    Transfers are aggregated per (sender, receiver) pair into time buckets
+    of bucket_seconds, kept for as long as the longest window. Every window
+    holds running per-account totals (transfer counts in and out, amounts,
+    distinct counterparties) over its buckets: a bucket is added when it
+    arrives and subtracted when the window rolls past it, so a query is a
+    few array reads and an update touches only the buckets that moved.
+
+    Windows end at the newest bucket seen, or at the time given to
+    advance(). Transfers older than the longest window or without a
+    BookingDateTime are ignored.
+    """
+
+    def __init__(self, bucket_seconds=3600, windows=WINDOWS, capacity=1024):
+        self.bucket_ns = bucket_seconds * 10 ** 9
+        self.windows = {
+            name: _Window(max(1, seconds // bucket_seconds), capacity) for name, seconds in windows.items()
+        }
+        self.max_span = max(window.span for window in self.windows.values())
+        self.account_index = {}
+        self.account_ids = []
+        # Bucket number -> (src, dst, count, amount) per pair, for the longest window
+        self.buckets = {}
+        self.current = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_transactions(cls, transactions_df, **kwargs):
+        graph = cls(**kwargs)
+        graph.add_transactions(transactions_df)
+        return graph
+
+    def __len__(self):
+        return len(self.account_ids)
+
+    def index_of(self, account_id):
+        """Integer index of an account, -1 if it never transferred"""
+        return self.account_index.get(account_id, -1)
+
+    def _indices(self, account_ids):
+        """Integer indices for accounts, registering unseen ones (caller holds the lock)"""
+        indices = np.empty(len(account_ids), dtype=np.int64)
+        for i, account_id in enumerate(account_ids):
+            index = self.account_index.get(account_id)
+            if index is None:
+                index = self.account_index[account_id] = len(self.account_ids)
+                self.account_ids.append(account_id)
+            indices[i] = index
+        capacity = len(next(iter(self.windows.values())).arrays['in_degree'])
+        if len(self.account_ids) > capacity:
+            for window in self.windows.values():
+                window.grow(max(capacity * 2, len(self.account_ids)))
+        return indices
+
+    def add_transactions(self, transactions_df, source='AccountId', target='ToAccountId',
+                         amount='TransactionAmount', timestamp='BookingDateTime'):
+        """Add transfers, rolling the windows forward to the newest bucket among them"""
+        if target in transactions_df.columns:
+            receivers = transactions_df[target]
+        else:
+            receivers = parse_creditor_account_ids(transactions_df['CreditorAccount'])
+        ts = pd.to_datetime(transactions_df[timestamp], utc=True, format='ISO8601')
+        usable = (receivers.notna() & ts.notna()).to_numpy()
+        transfers = pd.DataFrame({
+            'bucket': ts[usable].dt.as_unit('ns').astype('int64').to_numpy() // self.bucket_ns,
+            'src': transactions_df[source][usable].astype(str).to_numpy(),
+            'dst': receivers[usable].astype(str).to_numpy(),
+            'amount': transactions_df[amount].to_numpy(dtype=np.float64)[usable],
+        })
+        if transfers.empty:
+            return
+
+        with self._lock:
+            codes, account_ids = pd.factorize(pd.concat([transfers['src'], transfers['dst']], ignore_index=True))
+            index = self._indices(account_ids)
+            transfers['src'] = index[codes[:len(transfers)]]
+            transfers['dst'] = index[codes[len(transfers):]]
+            grouped = transfers.groupby(['bucket', 'src', 'dst'], sort=True).agg(
+                count=('amount', 'size'), amount=('amount', 'sum')
+            ).reset_index()
+
+            newest = int(grouped['bucket'].iloc[-1])
+            if self.current is None or newest > self.current:
+                self._roll(newest)
+            bucket_numbers = grouped['bucket'].to_numpy()
+            starts = np.flatnonzero(np.r_[True, bucket_numbers[1:] != bucket_numbers[:-1]])
+            for start, end in zip(starts, np.r_[starts[1:], len(grouped)]):
+                self._add_bucket(int(bucket_numbers[start]), grouped.iloc[start:end])
+
+    def _add_bucket(self, number, rows):
+        age = self.current - number
+        if age >= self.max_span:
+            return
+        bucket = (
+            rows['src'].to_numpy(dtype=np.int64),
+            rows['dst'].to_numpy(dtype=np.int64),
+            rows['count'].to_numpy(dtype=np.int64),
+            rows['amount'].to_numpy(dtype=np.float64)
+        )
+        for window in self.windows.values():
+            if age < window.span:
+                window.apply(bucket, 1)
+
+        # Merge with transfers already kept for this bucket
+        if number in self.buckets:
+            src, dst, count, amount = (np.concatenate(pair) for pair in zip(self.buckets[number], bucket))
+            merged = pd.DataFrame({'src': src, 'dst': dst, 'count': count, 'amount': amount}) \
+                .groupby(['src', 'dst'], sort=False).sum().reset_index()
+            bucket = tuple(merged[column].to_numpy() for column in ('src', 'dst', 'count', 'amount'))
+        self.buckets[number] = bucket
+
+    def _roll(self, newest):
+        """Move the window end to bucket newest, subtracting buckets that fall out (caller holds the lock)"""
+        if self.current is not None:
+            for number, bucket in self.buckets.items():
+                for window in self.windows.values():
+                    # In the window before the roll, out of it after
+                    if self.current - window.span < number <= newest - window.span:
+                        window.apply(bucket, -1)
+        self.current = newest
+        for number in [number for number in self.buckets if number <= newest - self.max_span]:
+            del self.buckets[number]
+
+    def advance(self, now=None):
+        """Roll the windows forward to now (a timestamp, default the current time)"""
+        now = pd.Timestamp.now(tz='UTC') if now is None else pd.Timestamp(now)
+        newest = now.as_unit('ns').value // self.bucket_ns
+        with self._lock:
+            if self.current is None or newest > self.current:
+                self._roll(newest)
+
+    def feature_names(self):
+        return [f"{name}_{window_name}" for window_name in self.windows for name in WINDOW_FEATURES]
+
+    def features(self, account_id):
+        """Windowed features of one account, e.g. out_degree_1h, zeros if it never transferred"""
+        index = self.index_of(account_id)
+        with self._lock:
+            return {
+                f"{name}_{window_name}": float(window.arrays[name][index]) if index >= 0 else 0.0
+                for window_name, window in self.windows.items()
+                for name in WINDOW_FEATURES
+            }
+
+    def feature_matrix(self, account_ids):
+        """Windowed features of many accounts as a DataFrame, columns like features()"""
+        indices = np.fromiter((self.index_of(a) for a in account_ids), dtype=np.int64, count=len(account_ids))
+        known = indices >= 0
+        columns = {}
+        with self._lock:
+            for window_name, window in self.windows.items():
+                for name in WINDOW_FEATURES:
+                    values = np.zeros(len(indices))
+                    values[known] = window.arrays[name][indices[known]]
+                    columns[f"{name}_{window_name}"] = values
+        return pd.DataFrame(columns)
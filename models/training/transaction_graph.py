@@ -0,0 +1,295 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Timestamp of transfers without a BookingDateTime (NaT as int64)
+NO_TIMESTAMP = np.iinfo(np.int64).min
+
+
+def parse_creditor_account_ids(creditor_accounts):
+    """Extract recipient AccountIds from CreditorAccount dict strings without eval"""
+    return creditor_accounts.astype(str).str.extract(r"""['"]AccountId['"]\s*:\s*['"]([^'"]+)['"]""")[0]
+
+
+def aggregate_transfers(transactions_df, source='AccountId', target='ToAccountId',
+                        amount='TransactionAmount', timestamp='BookingDateTime'):
+    """Aggregate transfers per (sender, receiver) pair
+
+    Returns the account ids seen and a frame of src/dst codes into them with
+    count, amount sum and first/last timestamp per pair. The target column
+    is parsed out of CreditorAccount when missing, transfers without a
+    recipient are left out.
+    """
+    if target in transactions_df.columns:
+        receivers = transactions_df[target]
+    else:
+        receivers = parse_creditor_account_ids(transactions_df['CreditorAccount'])
+    has_receiver = receivers.notna().to_numpy()
+    senders = transactions_df[source][has_receiver].astype(str)
+    receivers = receivers[has_receiver].astype(str)
+
+    codes, account_ids = pd.factorize(pd.concat([senders, receivers], ignore_index=True))
+    n_transfers = len(senders)
+    edges = pd.DataFrame({
+        'src': codes[:n_transfers],
+        'dst': codes[n_transfers:],
+        'amount': transactions_df[amount].to_numpy(dtype=np.float64)[has_receiver],
+    })
+    if timestamp in transactions_df.columns:
+        edges['ts'] = pd.to_datetime(
+            transactions_df[timestamp][has_receiver].to_numpy(), utc=True, format='ISO8601'
+        ).as_unit('ns').asi8
+    else:
+        edges['ts'] = NO_TIMESTAMP
+
+    grouped = edges.groupby(['src', 'dst'], sort=False).agg(
+        count=('amount', 'size'),
+        amount=('amount', 'sum'),
+        first_ts=('ts', 'min'),
+        last_ts=('ts', 'max')
+    ).reset_index()
+    return np.asarray(account_ids, dtype=object), grouped
+
+
+def account_fraud_flags(transactions_df, node_ids, source='AccountId', target='ToAccountId', label='FraudType'):
+    """Whether each account sent or received a fraudulent transfer, one groupby per side
+
+    Returns a frame indexed by node_ids with boolean sent_fraud and
+    received_fraud columns; a transfer is fraudulent when label is set.
+    """
+    is_fraud = transactions_df[label].notna()
+    if target in transactions_df.columns:
+        receivers = transactions_df[target]
+    else:
+        receivers = parse_creditor_account_ids(transactions_df['CreditorAccount'])
+
+    sent = is_fraud.groupby(transactions_df[source].astype(str), sort=False).any()
+    has_receiver = receivers.notna()
+    received = is_fraud[has_receiver].groupby(receivers[has_receiver].astype(str), sort=False).any()
+    return pd.DataFrame({
+        'sent_fraud': sent.reindex(node_ids, fill_value=False).to_numpy(dtype=bool),
+        'received_fraud': received.reindex(node_ids, fill_value=False).to_numpy(dtype=bool),
+    }, index=pd.Index(node_ids, name='AccountId'))
+
+
+def fraud_labels(transactions_df, node_ids, **columns):
+    """0/1 label per account in node_ids order, 1 when it sent or received a fraudulent transfer"""
+    flags = account_fraud_flags(transactions_df, node_ids, **columns)
+    labels = (flags['sent_fraud'] | flags['received_fraud']).to_numpy(dtype=np.int64)
+    logger.info(
+        f"Labelled {labels.sum()} of {len(labels)} accounts as fraudulent "
+        f"({int(flags['sent_fraud'].sum())} senders, {int(flags['received_fraud'].sum())} receivers)"
+    )
+    return labels
+
+
+class TransactionGraph:
+    """Directed transfer graph held as compressed sparse row and column arrays
+
+    Accounts are integer-encoded: node i is node_ids[i] and node_index maps
+    an AccountId back to i. Parallel transfers between two accounts are
+    aggregated into one edge carrying the transfer count, amount sum and
+    first/last timestamp (ns since the epoch, NaT as int64 min when the
+    transactions have no BookingDateTime).
+
+    Edge arrays are sorted by (source, target), so the out-edges of node i
+    are positions indptr[i]:indptr[i + 1] (CSR). The in-edges of node i are
+    positions in_edges[in_indptr[i]:in_indptr[i + 1]] into the same arrays
+    (CSC, built on first use). Degrees count distinct counterparties like
+    networkx.DiGraph.
+
+    add_transactions() applies new transfers in place. version is bumped on
+    every change so derived structures (e.g. transition matrices) know when
+    to rebuild.
+    """
+
+    def __init__(self, node_ids, src, dst, count, amount, first_ts, last_ts):
+        self.node_ids = np.asarray(node_ids, dtype=object)
+        self.node_index = {account_id: i for i, account_id in enumerate(self.node_ids)}
+        self.n_nodes = len(self.node_ids)
+
+        keys = _edge_keys(np.asarray(src), np.asarray(dst))
+        order = np.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        self.src = np.asarray(src, dtype=np.int32)[order]
+        self.dst = np.asarray(dst, dtype=np.int32)[order]
+        self.count = np.asarray(count, dtype=np.int64)[order]
+        self.amount = np.asarray(amount, dtype=np.float64)[order]
+        self.first_ts = np.asarray(first_ts, dtype=np.int64)[order]
+        self.last_ts = np.asarray(last_ts, dtype=np.int64)[order]
+        self.n_edges = len(self.src)
+
+        self.out_degree = np.bincount(self.src, minlength=self.n_nodes)
+        self.in_degree = np.bincount(self.dst, minlength=self.n_nodes)
+        self.indptr = np.concatenate([[0], np.cumsum(self.out_degree)])
+        self._in_edges = None
+
+        self.out_weight = np.bincount(self.src, weights=self.amount, minlength=self.n_nodes)
+        self.in_weight = np.bincount(self.dst, weights=self.amount, minlength=self.n_nodes)
+        self.version = 0
+
+    @classmethod
+    def from_transactions(cls, transactions_df, source='AccountId', target='ToAccountId',
+                          amount='TransactionAmount', timestamp='BookingDateTime'):
+        """Build the graph from a transactions frame in one vectorized pass"""
+        node_ids, grouped = aggregate_transfers(transactions_df, source, target, amount, timestamp)
+        graph = cls(
+            node_ids,
+            grouped['src'].to_numpy(),
+            grouped['dst'].to_numpy(),
+            grouped['count'].to_numpy(),
+            grouped['amount'].to_numpy(),
+            grouped['first_ts'].to_numpy(),
+            grouped['last_ts'].to_numpy()
+        )
+        logger.info(
+            f"Graph built with {graph.n_nodes} nodes and {graph.n_edges} edges "
+            f"from {graph.count.sum()} transfers"
+        )
+        return graph
+
+    def add_transactions(self, transactions_df, source='AccountId', target='ToAccountId',
+                         amount='TransactionAmount', timestamp='BookingDateTime'):
+        """Apply new transfers in place, returns the indices of accounts not seen before
+
+        Transfers on existing edges update their aggregates where they are.
+        New edges are inserted into the sorted arrays in one pass per array
+        and node aggregates are adjusted without a rebuild.
+        """
+        account_ids, grouped = aggregate_transfers(transactions_df, source, target, amount, timestamp)
+        index = np.fromiter(
+            (self.node_index.get(account_id, -1) for account_id in account_ids),
+            dtype=np.int64,
+            count=len(account_ids)
+        )
+        new_nodes = np.flatnonzero(index < 0)
+        if len(new_nodes):
+            index[new_nodes] = np.arange(self.n_nodes, self.n_nodes + len(new_nodes))
+            self.node_ids = np.concatenate([self.node_ids, account_ids[new_nodes]])
+            self.node_index.update(zip(account_ids[new_nodes], index[new_nodes].tolist()))
+            self.n_nodes += len(new_nodes)
+            for name in ('out_degree', 'in_degree', 'out_weight', 'in_weight'):
+                array = getattr(self, name)
+                setattr(self, name, np.concatenate([array, np.zeros(len(new_nodes), dtype=array.dtype)]))
+
+        src = index[grouped['src'].to_numpy()]
+        dst = index[grouped['dst'].to_numpy()]
+        count = grouped['count'].to_numpy()
+        batch_amount = grouped['amount'].to_numpy()
+        first_ts = grouped['first_ts'].to_numpy()
+        last_ts = grouped['last_ts'].to_numpy()
+
+        keys = _edge_keys(src, dst)
+        positions = np.searchsorted(self._keys, keys)
+        found = positions < self.n_edges
+        found[found] = self._keys[positions[found]] == keys[found]
+
+        existing = positions[found]
+        self.count[existing] += count[found]
+        self.amount[existing] += batch_amount[found]
+        self.first_ts[existing] = np.minimum(self.first_ts[existing], first_ts[found])
+        self.last_ts[existing] = np.maximum(self.last_ts[existing], last_ts[found])
+
+        added = ~found
+        if added.any():
+            order = np.argsort(keys[added], kind='stable')
+            insert_at = positions[added][order]
+            for name, values in (
+                ('_keys', keys), ('src', src), ('dst', dst), ('count', count),
+                ('amount', batch_amount), ('first_ts', first_ts), ('last_ts', last_ts)
+            ):
+                array = getattr(self, name)
+                setattr(self, name, np.insert(array, insert_at, values[added][order].astype(array.dtype)))
+            self.n_edges = len(self._keys)
+            self.out_degree += np.bincount(src[added], minlength=self.n_nodes)
+            self.in_degree += np.bincount(dst[added], minlength=self.n_nodes)
+            self.indptr = np.concatenate([[0], np.cumsum(self.out_degree)])
+            self._in_edges = None
+
+        self.out_weight += np.bincount(src, weights=batch_amount, minlength=self.n_nodes)
+        self.in_weight += np.bincount(dst, weights=batch_amount, minlength=self.n_nodes)
+        self.version += 1
+        return index[new_nodes]
+
+    @property
+    def in_edges(self):
+        return self._csc()[0]
+
+    @property
+    def in_indptr(self):
+        return self._csc()[1]
+
+    def _csc(self):
+        """In-edge permutation and pointers, rebuilt after edges were inserted"""
+        if self._in_edges is None:
+            self._in_edges = (
+                np.argsort(self.dst, kind='stable').astype(np.int64),
+                np.concatenate([[0], np.cumsum(self.in_degree)])
+            )
+        return self._in_edges
+
+    def nodes(self):
+        """AccountIds of all nodes, in index order"""
+        return list(self.node_ids)
+
+    def index_of(self, account_id):
+        """Integer index of an account, -1 if it is not in the graph"""
+        return self.node_index.get(account_id, -1)
+
+    def successors(self, i):
+        return self.dst[self.indptr[i]:self.indptr[i + 1]]
+
+    def predecessors(self, i):
+        return self.src[self.in_edges[self.in_indptr[i]:self.in_indptr[i + 1]]]
+
+    def neighbourhood(self, nodes, hops=1):
+        """Sorted indices of nodes within hops transfers of nodes in either direction, nodes included"""
+        reached = np.zeros(self.n_nodes, dtype=bool)
+        frontier = np.unique(np.asarray(nodes, dtype=np.int64))
+        reached[frontier] = True
+        for _ in range(hops):
+            neighbours = np.unique(np.concatenate([
+                self.dst[_row_positions(self.indptr, frontier)],
+                self.src[self.in_edges[_row_positions(self.in_indptr, frontier)]]
+            ]))
+            frontier = neighbours[~reached[neighbours]]
+            if not len(frontier):
+                break
+            reached[frontier] = True
+        return np.flatnonzero(reached)
+
+    def to_scipy(self, weight=None):
+        """(n_nodes, n_nodes) scipy.sparse CSR adjacency, weighted by an edge array name or 1"""
+        from scipy.sparse import csr_matrix
+
+        data = np.ones(self.n_edges) if weight is None else getattr(self, weight).astype(np.float64)
+        return csr_matrix((data, self.dst, self.indptr), shape=(self.n_nodes, self.n_nodes))
+
+    def to_networkx(self, weight=None):
+        """networkx.DiGraph copy for algorithms without an array version, weighted by an edge array name"""
+        import networkx as nx
+
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.node_ids)
+        if weight is None:
+            graph.add_edges_from(zip(self.node_ids[self.src], self.node_ids[self.dst]))
+        else:
+            graph.add_weighted_edges_from(
+                zip(self.node_ids[self.src], self.node_ids[self.dst], getattr(self, weight).tolist())
+            )
+        return graph
+
+
+def _edge_keys(src, dst):
+    """int64 keys ordering edges by (source, target)"""
+    return (src.astype(np.int64) << 32) | dst.astype(np.int64)
+
+
+def _row_positions(indptr, rows):
+    """Concatenated positions indptr[r]:indptr[r + 1] of every row in rows"""
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())